@@ -0,0 +1,121 @@
+"""
+Vercel関数で共有するJPEGの品質の自動選択（process.py / process-multiple.py から使用）
+
+ファイル名が _ で始まるため、Vercelは関数（エンドポイント）として公開しません。
+"""
+import math
+from io import BytesIO
+from PIL import Image, ImageChops, ImageStat
+from typing import Optional
+
+# JPEGの品質の自動選択の探索範囲
+MIN_QUALITY = 40
+MAX_QUALITY = 95
+DEFAULT_QUALITY = 95
+# 試し圧縮のサンプル（16行単位の帯を一定間隔で切り出す。元画像の1/4の行を使用）
+SAMPLE_BAND_HEIGHT = 32
+SAMPLE_BAND_PERIOD = 128
+# 推定誤差を見込んで、上限より少し小さいサイズを目標にする
+BUDGET_MARGIN = 0.95
+
+
+def encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def _quality_sample(image: Image.Image) -> Image.Image:
+    """一定間隔の帯を切り出して繋げたサンプル画像"""
+    if image.height < SAMPLE_BAND_PERIOD * 2:
+        return image
+    tops = range(0, image.height - SAMPLE_BAND_HEIGHT + 1, SAMPLE_BAND_PERIOD)
+    sample = Image.new(image.mode, (image.width, SAMPLE_BAND_HEIGHT * len(tops)))
+    for i, top in enumerate(tops):
+        sample.paste(image.crop((0, top, image.width, top + SAMPLE_BAND_HEIGHT)), (0, i * SAMPLE_BAND_HEIGHT))
+    return sample
+
+
+def _psnr(reference: Image.Image, encoded: bytes) -> float:
+    """圧縮前の画像と圧縮後のJPEGのPSNR（dB）"""
+    decoded = Image.open(BytesIO(encoded)).convert(reference.mode)
+    stat = ImageStat.Stat(ImageChops.difference(reference, decoded))
+    mse = sum(stat.sum2) / (reference.width * reference.height * len(stat.sum2))
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def _search_quality(accept) -> Optional[int]:
+    """accept(q) を満たす最小の品質を二分探索（qが大きいほど満たしやすい場合）"""
+    low, high, found = MIN_QUALITY, MAX_QUALITY, None
+    while low <= high:
+        mid = (low + high) // 2
+        if accept(mid):
+            found, high = mid, mid - 1
+        else:
+            low = mid + 1
+    return found
+
+
+def choose_quality(image: Image.Image, max_bytes: Optional[int] = None, min_psnr: Optional[float] = None) -> int:
+    """
+    出力サイズの上限（max_bytes）・画質の下限（min_psnr）を満たすJPEGの品質を、
+    サンプルの試し圧縮で選択します（backendの app/services/jpeg_quality.py と同じ方法）。
+    """
+    if max_bytes is None and min_psnr is None:
+        return DEFAULT_QUALITY
+    
+    sample = _quality_sample(image)
+    ratio = (image.width * image.height) / (sample.width * sample.height)
+    trials = {}
+    
+    def trial(quality: int) -> bytes:
+        if quality not in trials:
+            trials[quality] = encode_jpeg(sample, quality)
+        return trials[quality]
+    
+    def estimated_size(quality: int) -> float:
+        # ヘッダーは画像の大きさによらないため比例させない
+        header = len(encode_jpeg(Image.new(sample.mode, (16, 16)), quality))
+        return header + (len(trial(quality)) - header) * ratio
+    
+    quality = MAX_QUALITY
+    if min_psnr is not None:
+        quality = _search_quality(lambda q: _psnr(sample, trial(q)) >= min_psnr) or MAX_QUALITY
+    if max_bytes is not None:
+        budget = max_bytes * BUDGET_MARGIN
+        over = _search_quality(lambda q: estimated_size(q) > budget)
+        fits = MAX_QUALITY if over is None else max(over - 1, MIN_QUALITY)
+        quality = min(quality, fits)
+    return quality
+
+
+def _positive(value, convert, message: str):
+    """正の数（JSONの数値または数値の文字列）に変換し、それ以外は ValueError"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(message)
+    if convert is int and isinstance(value, float) and not value.is_integer():
+        raise ValueError(message)
+    try:
+        number = convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(message) from None
+    if not (number > 0 and math.isfinite(number)):
+        raise ValueError(message)
+    return number
+
+
+def parse_quality_options(data: dict) -> tuple[Optional[int], Optional[float]]:
+    """
+    リクエストの max_bytes / min_psnr を検証して数値に変換します
+    （backendの _validate_quality_options と同じ条件）。
+
+    Raises:
+        ValueError: 正の数でない場合（メッセージはそのまま400のエラーに使う）
+    """
+    max_bytes = _positive(data.get('max_bytes'), int, "max_bytesは正の整数である必要があります")
+    min_psnr = _positive(data.get('min_psnr'), float, "min_psnrは正の数である必要があります")
+    return max_bytes, min_psnr
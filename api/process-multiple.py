@@ -1,11 +1,18 @@
 import json
 import base64
 import logging
+import os
+import sys
 from io import BytesIO
 from PIL import Image
+from typing import Optional
 import zipfile
 from http.server import BaseHTTPRequestHandler
 
+# 共有モジュール（api/_jpeg_quality.py）を読み込めるように、このファイルのディレクトリをインポートパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _jpeg_quality import choose_quality, encode_jpeg, parse_quality_options  # noqa: E402
+
 # ロギング設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -61,7 +68,12 @@ def resize_to_target(image: Image.Image, target_size: tuple[int, int]) -> Image.
             return resized.crop((0, crop_top, target_width, crop_top + target_height))
 
 
-def process_image_sync(image_data: bytes, mode: str) -> bytes:
+def process_image_sync(
+    image_data: bytes,
+    mode: str,
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None
+) -> tuple[bytes, int]:
     """同期的な画像処理（軽量版：Pillowのみ）"""
     image = Image.open(BytesIO(image_data))
     
@@ -79,10 +91,8 @@ def process_image_sync(image_data: bytes, mode: str) -> bytes:
     if resized_image.size != target_size:
         resized_image = resized_image.resize(target_size, Image.Resampling.LANCZOS)
     
-    output = BytesIO()
-    resized_image.save(output, format="JPEG", quality=95)
-    output.seek(0)
-    return output.read()
+    quality = choose_quality(resized_image, max_bytes, min_psnr)
+    return encode_jpeg(resized_image, quality), quality
 
 
 class handler(BaseHTTPRequestHandler):
@@ -134,6 +144,13 @@ class handler(BaseHTTPRequestHandler):
             images_data = data.get('images', [])
             mode = data.get('mode', 'vertical')
             upscale_method = data.get('upscale_method', 'simple')
+            # JPEGの品質の自動選択（出力サイズの上限・画質の下限）
+            try:
+                max_bytes, min_psnr = parse_quality_options(data)
+            except ValueError as e:
+                logger.error(f"パラメータエラー: {e}")
+                self._send_error_response(400, str(e))
+                return
             
             if not images_data:
                 logger.error("画像データが空です")
@@ -159,7 +176,7 @@ class handler(BaseHTTPRequestHandler):
                     image_data_bytes = base64.b64decode(image_base64)
                     
                     # 画像処理
-                    processed_image = process_image_sync(image_data_bytes, mode)
+                    processed_image, quality = process_image_sync(image_data_bytes, mode, max_bytes, min_psnr)
                     
                     # Base64エンコード
                     result_base64 = base64.b64encode(processed_image).decode('utf-8')
@@ -167,7 +184,9 @@ class handler(BaseHTTPRequestHandler):
                     processed_images.append({
                         'filename': filename,
                         'data': f'data:image/jpeg;base64,{result_base64}',
-                        'content_type': 'image/jpeg'
+                        'content_type': 'image/jpeg',
+                        'quality': quality,
+                        'bytes': len(processed_image)
                     })
                     
                     logger.info(f"画像処理完了 ({idx+1}/{len(images_data)}): {filename}")
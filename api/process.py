@@ -1,10 +1,17 @@
 import json
 import base64
 import logging
+import os
+import sys
 from io import BytesIO
 from PIL import Image
+from typing import Optional
 from http.server import BaseHTTPRequestHandler
 
+# 共有モジュール（api/_jpeg_quality.py）を読み込めるように、このファイルのディレクトリをインポートパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _jpeg_quality import choose_quality, encode_jpeg, parse_quality_options  # noqa: E402
+
 # ロギング設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -65,7 +72,12 @@ def resize_to_target(image: Image.Image, target_size: tuple[int, int]) -> Image.
             return resized.crop((0, crop_top, target_width, crop_top + target_height))
 
 
-def process_image_sync(image_data: bytes, mode: str) -> bytes:
+def process_image_sync(
+    image_data: bytes,
+    mode: str,
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None
+) -> tuple[bytes, int]:
     """同期的な画像処理（軽量版：Pillowのみ）"""
     # 画像を開く
     image = Image.open(BytesIO(image_data))
@@ -89,11 +101,11 @@ def process_image_sync(image_data: bytes, mode: str) -> bytes:
     if resized_image.size != target_size:
         resized_image = resized_image.resize(target_size, Image.Resampling.LANCZOS)
     
+    # 出力サイズの上限・画質の下限が指定された場合は、試し圧縮で品質を選択
+    quality = choose_quality(resized_image, max_bytes, min_psnr)
+    
     # バイトデータに変換
-    output = BytesIO()
-    resized_image.save(output, format="JPEG", quality=95)
-    output.seek(0)
-    return output.read()
+    return encode_jpeg(resized_image, quality), quality
 
 
 class handler(BaseHTTPRequestHandler):
@@ -150,6 +162,13 @@ class handler(BaseHTTPRequestHandler):
             
             mode = data.get('mode', 'vertical')
             upscale_method = data.get('upscale_method', 'simple')
+            # JPEGの品質の自動選択（出力サイズの上限・画質の下限）
+            try:
+                max_bytes, min_psnr = parse_quality_options(data)
+            except ValueError as e:
+                logger.error(f"パラメータエラー: {e}")
+                self._send_error_response(400, str(e))
+                return
             
             logger.info(f"画像処理開始: mode={mode}, upscale_method={upscale_method}")
             
@@ -165,7 +184,7 @@ class handler(BaseHTTPRequestHandler):
             
             # 画像処理（軽量版：AIアップスケールは無効）
             try:
-                processed_image = process_image_sync(image_data, mode)
+                processed_image, quality = process_image_sync(image_data, mode, max_bytes, min_psnr)
             except Exception as e:
                 logger.error(f"画像処理エラー: {e}", exc_info=True)
                 self._send_error_response(500, f"画像処理に失敗: {str(e)}")
@@ -180,7 +199,9 @@ class handler(BaseHTTPRequestHandler):
             response_data = {
                 'success': True,
                 'image': result_base64,
-                'content_type': 'image/jpeg'
+                'content_type': 'image/jpeg',
+                'quality': quality,
+                'bytes': len(processed_image)
             }
             
             self._send_json_response(200, response_data)
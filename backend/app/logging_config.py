@@ -0,0 +1,110 @@
+"""
+ロギング設定
+
+ログレコードはキューに積むだけで呼び出し元に戻り、フォーマットと出力は
+別スレッド（QueueListener）で行います。リクエスト処理のスレッドではメッセージの
+フォーマットを行いません。
+
+- LOG_LEVEL: ログレベル（デフォルト: INFO）
+- LOG_FORMAT: "text"（デフォルト）または "json"
+- LOG_SAMPLE_RATE: 処理段階ごとの詳細ログを出力するリクエストの割合（0.0〜1.0, デフォルト: 0.0）
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# LogRecordの標準属性（これ以外は extra で渡された構造化フィールドとして扱う）
+_STANDARD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "taskName"}
+
+_sample_rate = 0.0
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def stage_sampled() -> bool:
+    """このリクエストで処理段階ごとの詳細ログを出力するかどうか"""
+    return _sample_rate > 0 and random.random() < _sample_rate
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _STANDARD_ATTRS}
+
+
+class StructuredFormatter(logging.Formatter):
+    """extra で渡されたフィールドを key=value（text）またはJSONのキーとして出力"""
+
+    def __init__(self, json_output: bool = False):
+        super().__init__(TEXT_FORMAT)
+        self.json_output = json_output
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = _extra_fields(record)
+        if not self.json_output:
+            text = super().format(record)
+            if fields:
+                text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+            return text
+
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **fields,
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    フォーマットせずにレコードをキューへ積むQueueHandler
+
+    標準のQueueHandlerは呼び出し元のスレッドでメッセージをフォーマットしますが、
+    同一プロセス内のキューではその必要がないため、フォーマットをリスナー側に任せます。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _start_listener(level: int, formatter: logging.Formatter):
+    global _listener
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def setup_logging():
+    """ルートロガーにキュー経由の非同期ハンドラーを設定します。"""
+    global _sample_rate
+    level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    formatter = StructuredFormatter(json_output=os.getenv("LOG_FORMAT", "text").lower() == "json")
+    _sample_rate = min(max(float(os.getenv("LOG_SAMPLE_RATE", "0")), 0.0), 1.0)
+
+    _start_listener(level, formatter)
+    atexit.register(_stop_listener)
+    # gunicornのpreload_appでフォークした子プロセスにはリスナーのスレッドが引き継がれないため再作成
+    os.register_at_fork(after_in_child=lambda: _start_listener(level, formatter))
@@ -1,13 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import image
-import logging
+from app.logging_config import setup_logging
 
-# ロギング設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# ロギング設定（キュー経由でリクエスト処理のスレッドから出力を切り離す）
+setup_logging()
+
+from app.routers import image
 
 app = FastAPI(title="画像リサイズ高解像度化API", version="1.0.0")
 
@@ -28,11 +26,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ブラウザから選択したJPEGの品質・出力サイズを参照できるようにする
+    expose_headers=["X-JPEG-Quality", "X-Output-Bytes"],
 )
 
 # ルーターの登録
 app.include_router(image.router, prefix="/api", tags=["image"])
 
+# AIモデルの事前読み込み（gunicornのpreload_appと併用するとワーカー間で重みを共有）
+if os.getenv("PRELOAD_AI_MODEL", "").lower() in ("1", "true", "yes"):
+    import gc
+    if not image.processor.preload_ai_model():
+        # 読み込めないまま起動すると、フォークした全ワーカーでAIアップスケールが無効になるため起動を中止する
+        raise RuntimeError("AIモデルの事前読み込みに失敗しました（PRELOAD_AI_MODEL）。ログを確認してください")
+    # 読み込み済みオブジェクトをGC対象外にし、フォーク後のコピーオンライトによるページ複製を抑える
+    gc.freeze()
+
 @app.get("/")
 async def root():
     return {"message": "画像リサイズ高解像度化API"}
@@ -1,36 +1,156 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import Response, JSONResponse
-from typing import Optional, List
-from app.services.image_processor import ImageProcessor
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
+from fastapi.responses import Response, JSONResponse, StreamingResponse
+from typing import Optional, List, AsyncIterator
+from app.services.image_processor import EncodedImage, ImageProcessor
+from app.services.lanes import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, LaneFullError
+from app.services.multipart_stream import StreamingMultipartParser, MultipartStreamError
+import asyncio
+import functools
 import logging
+import os
+import tempfile
+import time
 import zipfile
 import io
+import json
 import base64
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 processor = ImageProcessor()
 
+# アップスケール方法
+UPSCALE_METHODS = ["simple", "enhance", "ai"]
+
 # 最大ファイルサイズ: 50MB
 MAX_FILE_SIZE = 50 * 1024 * 1024
-# 最大画像数: 8枚
-MAX_IMAGES = 8
+# 最大画像数: 8枚（/api/process-multiple）
+MAX_IMAGES = int(os.getenv("MAX_IMAGES", "8"))
+# 一括処理の最大画像数: 500枚（/api/process-batch）
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "500"))
+# 一括処理で同時に処理する画像数（これを超えるとアップロードの受信を待機）
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", "4"))
+# 一括処理の結果をメモリに保持する上限（超えた分は一時ファイルに書き出す）
+BATCH_SPOOL_MEMORY = 8 * 1024 * 1024
+
+def _log_request_summary(endpoint: str):
+    """
+    リクエストごとに1件のサマリーログ（所要時間・ステータスなど）を出力するデコレーター
+    
+    ストリーミング応答の場合は、ストリームの終了時に各ジェネレーターが出力します。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            started = time.perf_counter()
+            summary = {"endpoint": endpoint, "status": 500}
+            for name in ("mode", "upscale_method", "response_format", "max_bytes", "min_psnr"):
+                if name in kwargs:
+                    summary[name] = kwargs[name]
+            if "file" in kwargs:
+                summary["upload_filename"] = kwargs["file"].filename
+            if "files" in kwargs:
+                summary["files"] = len(kwargs["files"])
+            response = None
+            try:
+                response = await func(**kwargs)
+                summary["status"] = response.status_code
+                return response
+            except HTTPException as e:
+                summary["status"] = e.status_code
+                raise
+            finally:
+                if not isinstance(response, StreamingResponse):
+                    if response is not None:
+                        summary["output_bytes"] = len(response.body)
+                    summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    logger.info("リクエスト処理完了", extra=summary)
+        return wrapper
+    return decorator
+
+
+def _log_stream_summary(endpoint: str, started: float, **fields):
+    """ストリーミング応答の終了時のサマリーログ"""
+    logger.info("リクエスト処理完了", extra={
+        "endpoint": endpoint,
+        "status": 200,
+        **fields,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+
+def _validate_quality_options(max_bytes: Optional[int], min_psnr: Optional[float]):
+    """JPEGの品質の自動選択のパラメータを検証します。"""
+    if max_bytes is not None and max_bytes <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail="max_bytesは正の整数である必要があります"
+        )
+    if min_psnr is not None and min_psnr <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail="min_psnrは正の数である必要があります"
+        )
+
+
+def _admit(upscale_method: str):
+    """
+    処理を実行するレーンが新しいリクエストを受け付けられるか確認します。
+    実行待ちが上限に達している場合は429（Retry-After付き）を返します。
+    """
+    lane = processor.lane_for(upscale_method)
+    try:
+        lane.admit()
+    except LaneFullError:
+        logger.warning("レーンが混雑しているためリクエストを拒否します: lane=%s", lane.name)
+        raise HTTPException(
+            status_code=429,
+            detail="サーバーが混雑しています。しばらく時間をおいて再度お試しください。",
+            headers={"Retry-After": str(lane.estimated_wait())}
+        )
+
+
+@router.get("/limits")
+async def get_limits():
+    """
+    クライアントが送信を分割するための上限値を返します。
+    """
+    return {
+        "max_images": MAX_IMAGES,
+        "max_batch_images": MAX_BATCH_IMAGES,
+        "max_file_size": MAX_FILE_SIZE,
+        "upscale_methods": UPSCALE_METHODS
+    }
+
+
+@router.get("/lanes")
+async def get_lanes():
+    """
+    実行レーン（simple: 単純リサイズ・高画質化, ai: AIアップスケール）ごとの
+    ワーカー数・実行待ち・処理数・待ち時間を返します。
+    """
+    return processor.lane_metrics()
+
 
 @router.post("/process")
+@_log_request_summary("/api/process")
 async def process_image(
     file: UploadFile = File(...),
     mode: str = Form("vertical"),  # "vertical" or "horizontal"
-    upscale_method: str = Form("simple")  # "simple" or "ai"
+    upscale_method: str = Form("simple"),  # "simple", "enhance" or "ai"
+    max_bytes: Optional[int] = Form(None),
+    min_psnr: Optional[float] = Form(None)
 ):
     """
     画像をリサイズ・アップスケール処理します。
     
     - mode: "vertical" (1080x1350) または "horizontal" (1350x1080)
-    - upscale_method: "simple" (単純リサイズ) または "ai" (AIアップスケール)
-    """
-    # デバッグログ: 受信したパラメータを確認
-    logger.info(f"画像処理リクエスト受信: mode={mode}, upscale_method={upscale_method}, filename={file.filename}")
+    - upscale_method: "simple" (単純リサイズ)、"enhance" (高速な高画質化) または "ai" (AIアップスケール)
+    - max_bytes: 出力サイズの上限（バイト）。指定するとJPEGの品質を自動で選択します
+    - min_psnr: 画質の下限（PSNR, dB）。指定すると条件を満たす最小の品質を選択します
     
+    選択した品質と出力サイズは X-JPEG-Quality / X-Output-Bytes ヘッダーで返します。
+    """
     # パラメータ検証
     if mode not in ["vertical", "horizontal"]:
         raise HTTPException(
@@ -38,12 +158,14 @@ async def process_image(
             detail="modeは'vertical'または'horizontal'である必要があります"
         )
     
-    if upscale_method not in ["simple", "ai"]:
+    if upscale_method not in UPSCALE_METHODS:
         raise HTTPException(
             status_code=400,
-            detail="upscale_methodは'simple'または'ai'である必要があります"
+            detail="upscale_methodは'simple'、'enhance'または'ai'である必要があります"
         )
     
+    _validate_quality_options(max_bytes, min_psnr)
+    
     # ファイルタイプ検証
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(
@@ -51,6 +173,8 @@ async def process_image(
             detail="画像ファイルをアップロードしてください"
         )
     
+    _admit(upscale_method)
+    
     try:
         # ファイルを読み込み
         contents = await file.read()
@@ -73,18 +197,22 @@ async def process_image(
             processed_image = await processor.process_image(
                 image_data=contents,
                 mode=mode,
-                upscale_method=upscale_method
+                upscale_method=upscale_method,
+                max_bytes=max_bytes,
+                min_psnr=min_psnr,
+                # 1枚ずつの処理は利用者が結果を待っているため、複数・一括処理より先に実行する
+                priority=PRIORITY_HIGH
             )
         except ValueError as e:
             # 画像形式エラーなど
-            logger.error(f"画像処理エラー (ValueError): {str(e)}")
+            logger.error("画像処理エラー (ValueError): %s", e)
             raise HTTPException(
                 status_code=400,
                 detail=f"画像の形式が正しくありません: {str(e)}"
             )
         except Exception as e:
             # その他の処理エラー
-            logger.error(f"画像処理エラー: {str(e)}", exc_info=True)
+            logger.error("画像処理エラー: %s", e, exc_info=True)
             raise HTTPException(
                 status_code=500,
                 detail=f"画像処理中にエラーが発生しました: {str(e)}"
@@ -94,10 +222,12 @@ async def process_image(
         content_type = file.content_type or "image/jpeg"
         
         return Response(
-            content=processed_image,
+            content=processed_image.data,
             media_type=content_type,
             headers={
-                "Content-Disposition": f"attachment; filename=processed_{file.filename or 'image.jpg'}"
+                "Content-Disposition": f"attachment; filename=processed_{file.filename or 'image.jpg'}",
+                "X-JPEG-Quality": str(processed_image.quality),
+                "X-Output-Bytes": str(len(processed_image.data))
             }
         )
     except HTTPException:
@@ -105,28 +235,162 @@ async def process_image(
         raise
     except Exception as e:
         # 予期しないエラー
-        logger.error(f"予期しないエラー: {str(e)}", exc_info=True)
+        logger.error("予期しないエラー: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail="サーバーエラーが発生しました。しばらく時間をおいて再度お試しください。"
         )
 
+async def _read_image_file(file: UploadFile, idx: int) -> tuple[Optional[bytes], Optional[str]]:
+    """
+    複数画像処理用にアップロードファイルを検証して読み込みます。
+    
+    Returns:
+        (ファイルの内容, エラーメッセージ) のどちらか一方
+    """
+    name = file.filename or f'ファイル{idx+1}'
+    # ファイルタイプ検証
+    if not file.content_type or not file.content_type.startswith("image/"):
+        return None, f"{name}: 画像ファイルではありません"
+    
+    # ファイルを読み込み
+    contents = await file.read()
+    
+    # ファイルサイズチェック
+    if len(contents) > MAX_FILE_SIZE:
+        return None, f"{name}: ファイルサイズが大きすぎます（最大{MAX_FILE_SIZE // (1024 * 1024)}MB）"
+    
+    if len(contents) == 0:
+        return None, f"{name}: 空のファイルです"
+    
+    return contents, None
+
+
+def _ndjson_line(event: dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def _process_to_event(
+    idx: int,
+    filename: Optional[str],
+    content_type: Optional[str],
+    contents: bytes,
+    mode: str,
+    upscale_method: str,
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None,
+    priority: int = PRIORITY_NORMAL
+) -> dict:
+    """1枚処理し、ストリーミング応答の1行分（画像またはエラー）を返します。"""
+    name = filename or f'ファイル{idx+1}'
+    try:
+        processed_image = await processor.process_image(
+            image_data=contents,
+            mode=mode,
+            upscale_method=upscale_method,
+            max_bytes=max_bytes,
+            min_psnr=min_psnr,
+            priority=priority
+        )
+    except ValueError as e:
+        return {"type": "error", "index": idx, "filename": name, "error": f"{name}: {str(e)}"}
+    except Exception as e:
+        logger.error("画像処理エラー (%s): %s", filename, e, exc_info=True)
+        return {"type": "error", "index": idx, "filename": name, "error": f"{name}: 処理に失敗しました"}
+    
+    content_type = content_type or "image/jpeg"
+    img_base64 = base64.b64encode(processed_image.data).decode('utf-8')
+    return {
+        "type": "image",
+        "index": idx,
+        "filename": filename or f"image_{idx+1}.jpg",
+        "data": f"data:{content_type};base64,{img_base64}",
+        "content_type": content_type,
+        "quality": processed_image.quality,
+        "bytes": len(processed_image.data)
+    }
+
+
+async def _stream_multiple_results(
+    files: List[UploadFile],
+    mode: str,
+    upscale_method: str,
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None
+) -> AsyncIterator[bytes]:
+    """
+    各画像の処理が完了した順にNDJSONで結果を返します。
+    
+    1行目以降に {"type": "image", ...} または {"type": "error", ...} を1枚ずつ出力し、
+    最後に {"type": "summary", ...} を出力します。送信済みの結果はメモリに保持しません。
+    """
+    async def process_one(idx: int, file: UploadFile) -> dict:
+        name = file.filename or f'ファイル{idx+1}'
+        try:
+            contents, error = await _read_image_file(file, idx)
+        except Exception as e:
+            logger.error("予期しないエラー (%s): %s", file.filename, e, exc_info=True)
+            return {"type": "error", "index": idx, "filename": name, "error": f"{name}: エラーが発生しました"}
+        if error:
+            return {"type": "error", "index": idx, "filename": name, "error": error}
+        return await _process_to_event(
+            idx, file.filename, file.content_type, contents, mode, upscale_method, max_bytes, min_psnr
+        )
+    
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(process_one(idx, file)) for idx, file in enumerate(files)]
+    succeeded = 0
+    errors = []
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            event = await next_result
+            if event["type"] == "image":
+                succeeded += 1
+            else:
+                errors.append(event["error"])
+            yield _ndjson_line(event)
+            del event
+    finally:
+        # クライアントが切断した場合は残りの処理をキャンセル
+        for task in tasks:
+            task.cancel()
+    
+    yield _ndjson_line({
+        "type": "summary",
+        "total": len(files),
+        "succeeded": succeeded,
+        "failed": len(errors),
+        "errors": errors if errors else None
+    })
+    _log_stream_summary(
+        "/api/process-multiple", started,
+        mode=mode, upscale_method=upscale_method, response_format="ndjson",
+        files=len(files), succeeded=succeeded, failed=len(errors)
+    )
+
+
 @router.post("/process-multiple")
+@_log_request_summary("/api/process-multiple")
 async def process_multiple_images(
     files: List[UploadFile] = File(...),
     mode: str = Form("vertical"),  # "vertical" or "horizontal"
-    upscale_method: str = Form("simple")  # "simple" or "ai"
+    upscale_method: str = Form("simple"),  # "simple", "enhance" or "ai"
+    response_format: str = Form("json"),  # "json" or "ndjson"
+    max_bytes: Optional[int] = Form(None),
+    min_psnr: Optional[float] = Form(None)
 ):
     """
     複数の画像をリサイズ・アップスケール処理します。
     
     - files: 最大8枚の画像ファイル
     - mode: "vertical" (1080x1350) または "horizontal" (1350x1080)
-    - upscale_method: "simple" (単純リサイズ) または "ai" (AIアップスケール)
-    """
-    # デバッグログ: 受信したパラメータを確認
-    logger.info(f"複数画像処理リクエスト受信: mode={mode}, upscale_method={upscale_method}, ファイル数={len(files)}")
+    - upscale_method: "simple" (単純リサイズ)、"enhance" (高速な高画質化) または "ai" (AIアップスケール)
+    - response_format: "json" (すべての処理後にまとめて返す) または
+      "ndjson" (完了した画像から1行ずつ返し、最後に集計行を返す)
+    - max_bytes / min_psnr: 画像ごとの出力サイズの上限・画質の下限（/api/process と同じ）
     
+    各画像の結果には選択したJPEGの品質（quality）と出力サイズ（bytes）が含まれます。
+    """
     # パラメータ検証
     if mode not in ["vertical", "horizontal"]:
         raise HTTPException(
@@ -134,10 +398,10 @@ async def process_multiple_images(
             detail="modeは'vertical'または'horizontal'である必要があります"
         )
     
-    if upscale_method not in ["simple", "ai"]:
+    if upscale_method not in UPSCALE_METHODS:
         raise HTTPException(
             status_code=400,
-            detail="upscale_methodは'simple'または'ai'である必要があります"
+            detail="upscale_methodは'simple'、'enhance'または'ai'である必要があります"
         )
     
     # ファイル数チェック
@@ -153,48 +417,62 @@ async def process_multiple_images(
             detail="画像ファイルをアップロードしてください"
         )
     
+    if response_format not in ["json", "ndjson"]:
+        raise HTTPException(
+            status_code=400,
+            detail="response_formatは'json'または'ndjson'である必要があります"
+        )
+    
+    _validate_quality_options(max_bytes, min_psnr)
+    
+    _admit(upscale_method)
+    
+    if response_format == "ndjson":
+        return StreamingResponse(
+            _stream_multiple_results(files, mode, upscale_method, max_bytes, min_psnr),
+            media_type="application/x-ndjson"
+        )
+    
     processed_images = []
     errors = []
+    # 同じ内容の画像はバッチ内で1回だけ処理する
+    batch_results: dict[str, EncodedImage] = {}
     
     for idx, file in enumerate(files):
         try:
-            # ファイルタイプ検証
-            if not file.content_type or not file.content_type.startswith("image/"):
-                errors.append(f"{file.filename or f'ファイル{idx+1}'}: 画像ファイルではありません")
-                continue
-            
-            # ファイルを読み込み
-            contents = await file.read()
-            
-            # ファイルサイズチェック
-            if len(contents) > MAX_FILE_SIZE:
-                errors.append(f"{file.filename or f'ファイル{idx+1}'}: ファイルサイズが大きすぎます（最大{MAX_FILE_SIZE // (1024 * 1024)}MB）")
-                continue
-            
-            if len(contents) == 0:
-                errors.append(f"{file.filename or f'ファイル{idx+1}'}: 空のファイルです")
+            contents, error = await _read_image_file(file, idx)
+            if error:
+                errors.append(error)
                 continue
             
             # 画像処理
             try:
-                processed_image = await processor.process_image(
-                    image_data=contents,
-                    mode=mode,
-                    upscale_method=upscale_method
-                )
+                key = await processor.work_key_async(contents, mode, upscale_method, max_bytes, min_psnr)
+                processed_image = batch_results.get(key)
+                if processed_image is None:
+                    processed_image = await processor.process_image(
+                        image_data=contents,
+                        mode=mode,
+                        upscale_method=upscale_method,
+                        max_bytes=max_bytes,
+                        min_psnr=min_psnr,
+                        key=key
+                    )
+                    batch_results[key] = processed_image
                 
                 processed_images.append({
                     "filename": file.filename or f"image_{idx+1}.jpg",
-                    "data": processed_image,
+                    "data": processed_image.data,
+                    "quality": processed_image.quality,
                     "content_type": file.content_type or "image/jpeg"
                 })
             except ValueError as e:
                 errors.append(f"{file.filename or f'ファイル{idx+1}'}: {str(e)}")
             except Exception as e:
-                logger.error(f"画像処理エラー ({file.filename}): {str(e)}", exc_info=True)
+                logger.error("画像処理エラー (%s): %s", file.filename, e, exc_info=True)
                 errors.append(f"{file.filename or f'ファイル{idx+1}'}: 処理に失敗しました")
         except Exception as e:
-            logger.error(f"予期しないエラー ({file.filename}): {str(e)}", exc_info=True)
+            logger.error("予期しないエラー (%s): %s", file.filename, e, exc_info=True)
             errors.append(f"{file.filename or f'ファイル{idx+1}'}: エラーが発生しました")
     
     # すべての画像の処理に失敗した場合
@@ -210,7 +488,9 @@ async def process_multiple_images(
         result_images.append({
             "filename": img["filename"],
             "data": f"data:{img['content_type']};base64,{img_base64}",
-            "content_type": img["content_type"]
+            "content_type": img["content_type"],
+            "quality": img["quality"],
+            "bytes": len(img["data"])
         })
     
     # ZIPファイルも作成（ダウンロード用）
@@ -228,3 +508,156 @@ async def process_multiple_images(
         "errors": errors if errors else None
     })
 
+
+
+def _validate_part(part: dict, idx: int) -> Optional[str]:
+    """一括処理のパートを検証し、エラーがあればメッセージを返します。"""
+    name = part["filename"] or f'ファイル{idx+1}'
+    if not part["content_type"] or not part["content_type"].startswith("image/"):
+        return f"{name}: 画像ファイルではありません"
+    if part["error"] == "too_large":
+        return f"{name}: ファイルサイズが大きすぎます（最大{MAX_FILE_SIZE // (1024 * 1024)}MB）"
+    if len(part["data"]) == 0:
+        return f"{name}: 空のファイルです"
+    return None
+
+
+@router.post("/process-batch")
+async def process_batch(
+    request: Request,
+    mode: str = "vertical",  # "vertical" or "horizontal"
+    upscale_method: str = "simple",  # "simple", "enhance" or "ai"
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None
+):
+    """
+    大量の画像を一括でリサイズ・アップスケール処理します。
+    
+    multipart/form-dataの "files" パートを受信した順に処理し、結果を
+    /api/process-multiple の response_format=ndjson と同じ形式で返します。
+    同時に処理する画像数が上限に達するとアップロードの受信を待機するため、
+    バッチサイズに関係なくサーバーのメモリ使用量は一定です。
+    
+    ボディを受信しながら処理するため、パラメータはクエリパラメータで指定します。
+    一括処理の画像は /api/process・/api/process-multiple より低い優先度で実行します。
+    
+    - mode: "vertical" (1080x1350) または "horizontal" (1350x1080)
+    - upscale_method: "simple" (単純リサイズ)、"enhance" (高速な高画質化) または "ai" (AIアップスケール)
+    - max_bytes / min_psnr: 画像ごとの出力サイズの上限・画質の下限（/api/process と同じ）
+    """
+    started = time.perf_counter()
+    
+    # パラメータ検証
+    if mode not in ["vertical", "horizontal"]:
+        raise HTTPException(
+            status_code=400,
+            detail="modeは'vertical'または'horizontal'である必要があります"
+        )
+    
+    if upscale_method not in UPSCALE_METHODS:
+        raise HTTPException(
+            status_code=400,
+            detail="upscale_methodは'simple'、'enhance'または'ai'である必要があります"
+        )
+    
+    _validate_quality_options(max_bytes, min_psnr)
+    
+    _admit(upscale_method)
+    
+    try:
+        parser = StreamingMultipartParser(request.headers.get("content-type", ""), MAX_FILE_SIZE)
+    except MultipartStreamError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # アップロード受信中に完了した結果は一時ファイルに書き出す
+    # （クライアントがアップロード完了までレスポンスを読まない場合でもメモリを消費しない）
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MEMORY)
+    in_flight: set[asyncio.Task] = set()
+    stats = {"total": 0, "succeeded": 0, "errors": []}
+    
+    def record(event: dict) -> bytes:
+        if event["type"] == "image":
+            stats["succeeded"] += 1
+        else:
+            stats["errors"].append(event["error"])
+        return _ndjson_line(event)
+    
+    async def wait_for_slot():
+        nonlocal in_flight
+        done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            spool.write(record(task.result()))
+    
+    def handle_parts(parts: list[dict]) -> None:
+        for part in parts:
+            if part["name"] != "files":
+                continue
+            idx = stats["total"]
+            stats["total"] += 1
+            name = part["filename"] or f'ファイル{idx+1}'
+            if idx >= MAX_BATCH_IMAGES:
+                spool.write(record({
+                    "type": "error", "index": idx, "filename": name,
+                    "error": f"{name}: 画像は最大{MAX_BATCH_IMAGES}枚まで処理できます"
+                }))
+                continue
+            error = _validate_part(part, idx)
+            if error:
+                spool.write(record({"type": "error", "index": idx, "filename": name, "error": error}))
+                continue
+            in_flight.add(asyncio.create_task(_process_to_event(
+                idx, part["filename"], part["content_type"], part["data"], mode, upscale_method,
+                max_bytes, min_psnr, PRIORITY_LOW
+            )))
+    
+    try:
+        async for chunk in request.stream():
+            handle_parts(parser.feed(chunk))
+            # ワーカーが埋まっている間は次のチャンクを読まない（アップロードにバックプレッシャーをかける）
+            while len(in_flight) >= BATCH_MAX_IN_FLIGHT:
+                await wait_for_slot()
+        handle_parts(parser.finalize())
+    except BaseException as e:
+        for task in in_flight:
+            task.cancel()
+        spool.close()
+        if isinstance(e, MultipartStreamError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+    
+    if stats["total"] == 0:
+        spool.close()
+        raise HTTPException(
+            status_code=400,
+            detail="画像ファイルをアップロードしてください"
+        )
+    
+    async def stream_results() -> AsyncIterator[bytes]:
+        try:
+            # 受信中に完了した結果
+            spool.seek(0)
+            while chunk := spool.read(64 * 1024):
+                yield chunk
+            spool.close()
+            # 処理中の結果は完了した順に返す
+            for next_result in asyncio.as_completed(in_flight):
+                yield record(await next_result)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            spool.close()
+        
+        yield _ndjson_line({
+            "type": "summary",
+            "total": stats["total"],
+            "succeeded": stats["succeeded"],
+            "failed": len(stats["errors"]),
+            "errors": stats["errors"] if stats["errors"] else None
+        })
+        _log_stream_summary(
+            "/api/process-batch", started,
+            mode=mode, upscale_method=upscale_method,
+            files=stats["total"], succeeded=stats["succeeded"], failed=len(stats["errors"])
+        )
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
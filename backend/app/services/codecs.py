@@ -0,0 +1,215 @@
+"""
+画像のデコード・エンコードを行うコーデック
+
+PillowとOpenCV（libjpeg-turbo/libpng/libwebpを同梱）の2つの実装があり、
+フォーマットごとに速い方を選択します。
+
+- IMAGE_CODEC: "auto"（起動時のマイクロベンチマークで選択, デフォルト）, "pillow", "opencv"
+- IMAGE_CODEC_JPEG / IMAGE_CODEC_PNG / IMAGE_CODEC_WEBP: フォーマットごとの指定（IMAGE_CODECより優先）
+- IMAGE_REDUCED_DECODE: "1" でJPEGを縮小デコード（出力サイズ以上を保つ範囲で1/2〜1/8）
+"""
+from PIL import Image
+import io
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 選択対象のフォーマット（PillowのImage.format名）
+FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+def _reduction_factor(source_size: tuple[int, int], target_size: tuple[int, int]) -> int:
+    """
+    縮小デコードの倍率（1, 2, 4, 8）を決定します。
+    縮小後もターゲットをカバーするのに必要なサイズ以上になる最大の倍率を返します。
+    """
+    scale = max(target_size[0] / source_size[0], target_size[1] / source_size[1])
+    for factor in (8, 4, 2):
+        if factor * scale <= 1:
+            return factor
+    return 1
+
+
+class PillowCodec:
+    """Pillowによるデコード・エンコード"""
+    name = "pillow"
+
+    def __init__(self, reduced_decode: bool = False):
+        self.reduced_decode = reduced_decode
+
+    def decode(self, data: bytes, target_size: Optional[tuple[int, int]] = None) -> Image.Image:
+        image = Image.open(io.BytesIO(data))
+        # 画像が正常に読み込めたか確認
+        image.verify()
+        # verify()は画像を閉じるので、再度開く必要がある
+        image = Image.open(io.BytesIO(data))
+        if self.reduced_decode and target_size and image.format == "JPEG":
+            factor = _reduction_factor(image.size, target_size)
+            if factor > 1:
+                image.draft(image.mode, (image.width // factor, image.height // factor))
+        return image
+
+    def encode(self, image: Image.Image, format: str, quality: int) -> bytes:
+        output = io.BytesIO()
+        image.save(output, format=format, quality=quality)
+        return output.getvalue()
+
+
+class OpenCVCodec:
+    """
+    OpenCVによるデコード・エンコード
+
+    8bit RGBの画像のみを扱います（透過・パレット・グレースケールなどはPillowで処理）。
+    Pillowとの受け渡しはnumpy配列で行い、色順の変換はその場で行います。
+    """
+    name = "opencv"
+
+    _EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+    def __init__(self, reduced_decode: bool = False):
+        import cv2
+        self._cv2 = cv2
+        self.reduced_decode = reduced_decode
+
+    def decode(self, data: bytes, target_size: Optional[tuple[int, int]] = None) -> Image.Image:
+        cv2 = self._cv2
+        # Pillowと同じくEXIFの回転情報は適用しない
+        flags = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+        if self.reduced_decode and target_size:
+            header = Image.open(io.BytesIO(data))
+            if header.format == "JPEG":
+                factor = _reduction_factor(header.size, target_size)
+                flags = {
+                    2: cv2.IMREAD_REDUCED_COLOR_2,
+                    4: cv2.IMREAD_REDUCED_COLOR_4,
+                    8: cv2.IMREAD_REDUCED_COLOR_8,
+                }.get(factor, cv2.IMREAD_COLOR) | cv2.IMREAD_IGNORE_ORIENTATION
+        array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if array is None:
+            raise ValueError("OpenCVで画像をデコードできませんでした")
+        cv2.cvtColor(array, cv2.COLOR_BGR2RGB, dst=array)
+        return Image.fromarray(array)
+
+    def encode(self, image: Image.Image, format: str, quality: int) -> bytes:
+        cv2 = self._cv2
+        array = np.asarray(image.convert("RGB") if image.mode != "RGB" else image)
+        array = cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
+        if format == "JPEG":
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif format == "WEBP":
+            params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        else:
+            params = []
+        ok, encoded = cv2.imencode(self._EXTENSIONS[format], array, params)
+        if not ok:
+            raise ValueError("OpenCVで画像をエンコードできませんでした")
+        return encoded.tobytes()
+
+
+def synthetic_gradient(
+    size: tuple[int, int],
+    noise: float = 12.0,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """
+    ベンチマーク・負荷試験用の合成画像（グラデーション + ノイズ, uint8の3チャンネル配列）
+
+    rngを省略した場合は固定のシードを使います（毎回同じ画像）。
+    """
+    width, height = size
+    rng = rng if rng is not None else np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + y * 0, y + x * 0, (x + y) / 2], axis=-1)
+    return np.clip(base + rng.normal(0, noise, size=(height, width, 3)), 0, 255).astype(np.uint8)
+
+
+def _benchmark_sample(size: tuple[int, int] = (640, 480)) -> Image.Image:
+    """ベンチマーク用の合成画像"""
+    return Image.fromarray(synthetic_gradient(size))
+
+
+def _best_time(func, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+class CodecSelector:
+    """フォーマットごとにデコード・エンコードのコーデックを選択します。"""
+
+    def __init__(self, decoders: dict, encoders: dict, fallback: PillowCodec):
+        self.decoders = decoders
+        self.encoders = encoders
+        self.fallback = fallback
+
+    @classmethod
+    def from_env(cls) -> "CodecSelector":
+        reduced_decode = os.getenv("IMAGE_REDUCED_DECODE", "").lower() in ("1", "true", "yes")
+        pillow = PillowCodec(reduced_decode=reduced_decode)
+        codecs = {"pillow": pillow}
+        try:
+            codecs["opencv"] = OpenCVCodec(reduced_decode=reduced_decode)
+        except ImportError:
+            logger.warning("OpenCVがインストールされていないため、Pillowのみを使用します")
+
+        default = os.getenv("IMAGE_CODEC", "auto").lower()
+        decoders, encoders = {}, {}
+        sample = None
+        for format in FORMATS:
+            choice = os.getenv(f"IMAGE_CODEC_{format}", default).lower()
+            if choice == "auto":
+                if len(codecs) == 1:
+                    choice = "pillow"
+                else:
+                    sample = sample or _benchmark_sample()
+                    decoders[format], encoders[format] = cls._benchmark(format, sample, codecs)
+                    continue
+            if choice not in codecs:
+                logger.warning("コーデック '%s' は利用できないため、Pillowを使用します (%s)", choice, format)
+                choice = "pillow"
+            decoders[format] = encoders[format] = codecs[choice]
+
+        logger.info(
+            "コーデック選択: %s",
+            ", ".join(f"{f}=decode:{decoders[f].name}/encode:{encoders[f].name}" for f in FORMATS)
+        )
+        return cls(decoders, encoders, pillow)
+
+    @staticmethod
+    def _benchmark(format: str, sample: Image.Image, codecs: dict) -> tuple:
+        """フォーマットごとにデコード・エンコードの速い方を選ぶ"""
+        data = codecs["pillow"].encode(sample, format, 90)
+        decode_times, encode_times = {}, {}
+        for name, codec in codecs.items():
+            try:
+                decode_times[name] = _best_time(lambda: codec.decode(data).load())
+                encode_times[name] = _best_time(lambda: codec.encode(sample, format, 90))
+            except Exception as e:
+                logger.warning("コーデックのベンチマークに失敗しました (%s, %s): %s", name, format, e)
+        fastest_decoder = min(decode_times, key=decode_times.get, default="pillow")
+        fastest_encoder = min(encode_times, key=encode_times.get, default="pillow")
+        return codecs[fastest_decoder], codecs[fastest_encoder]
+
+    def decode(self, data: bytes, target_size: Optional[tuple[int, int]] = None) -> Image.Image:
+        """
+        画像をデコードします。
+        OpenCVが扱えない画像（透過・パレット・16bitなど）はPillowでデコードします。
+        """
+        header = Image.open(io.BytesIO(data))
+        codec = self.decoders.get(header.format, self.fallback)
+        if codec is not self.fallback and header.mode != "RGB":
+            codec = self.fallback
+        return codec.decode(data, target_size)
+
+    def encode(self, image: Image.Image, format: str = "JPEG", quality: int = 95) -> bytes:
+        codec = self.encoders.get(format, self.fallback)
+        return codec.encode(image, format, quality)
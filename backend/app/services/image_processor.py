@@ -1,101 +1,183 @@
 from PIL import Image
-import io
 import numpy as np
-from typing import Literal, Optional
+from typing import BinaryIO, Literal, Optional, Union
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
 import logging
+import os
+from app.logging_config import stage_sampled
+from app.services.codecs import CodecSelector
+from app.services.jpeg_quality import choose_quality
+from app.services.lanes import PRIORITY_NORMAL, Lane
+from app.services.singleflight import SingleFlight
+from app.services.strip_resize import StripResizer, cover_geometry, to_rgb
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """処理済み画像（出力のバイトデータと、圧縮に使用したJPEGの品質）"""
+    data: bytes
+    quality: int
+
+
 class ImageProcessor:
     # 規定サイズ
     VERTICAL_SIZE = (1080, 1350)  # 幅×高さ
     HORIZONTAL_SIZE = (1350, 1080)  # 幅×高さ
+    # 出力設定（同一処理の判定キーに含める）
+    OUTPUT_FORMAT = "JPEG"
+    OUTPUT_QUALITY = 95
+    # Real-ESRGANの重み（AI_MODEL_PATH でローカルのファイルを指定可能）
+    REALESRGAN_WEIGHTS_URL = "https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth"
+    # これより大きいデータのハッシュ計算はイベントループを塞がないようスレッドで行う
+    _HASH_IN_THREAD_BYTES = 1024 * 1024
     
-    def __init__(self):
-        self.executor = ThreadPoolExecutor(max_workers=2)
+    def __init__(self, ai_backend: Optional[str] = None):
+        """
+        Args:
+            ai_backend: AIアップスケールの推論バックエンド（"realesrgan" または "onnx"）。
+                省略時は環境変数 AI_BACKEND（デフォルト: "realesrgan"）
+        """
+        # 単純リサイズ（simple/enhance）とAIアップスケールは別々のレーンで実行し、AIの処理が詰まっても単純リサイズを待たせない
+        self.lanes = {
+            "simple": Lane.from_env("simple", workers=2),
+            "ai": Lane.from_env("ai", workers=1),
+        }
+        self.codecs = CodecSelector.from_env()
+        self.strip_resizer = StripResizer.from_env()
+        self._single_flight = SingleFlight()
+        self.ai_backend = (ai_backend or os.getenv("AI_BACKEND", "realesrgan")).lower()
         self._ai_upscaler: Optional[object] = None
         self._ai_available = False
         self._check_ai_availability()
     
+    def work_key(
+        self,
+        image_data: bytes,
+        mode: str,
+        upscale_method: str,
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None
+    ) -> str:
+        """同一の処理かどうかを判定するキー（内容のハッシュ + 処理設定 + 出力設定）"""
+        digest = hashlib.sha256(image_data).hexdigest()
+        quality = self.OUTPUT_QUALITY
+        if max_bytes is not None or min_psnr is not None:
+            quality = f"auto(max_bytes={max_bytes},min_psnr={min_psnr})"
+        return f"{digest}:{mode}:{upscale_method}:{self.OUTPUT_FORMAT}:{quality}"
+    
+    async def work_key_async(
+        self,
+        image_data: bytes,
+        mode: str,
+        upscale_method: str,
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None
+    ) -> str:
+        """work_key() のasync版（大きな画像のハッシュ計算はイベントループを止めないよう別スレッドで行う）"""
+        if len(image_data) > self._HASH_IN_THREAD_BYTES:
+            return await asyncio.to_thread(self.work_key, image_data, mode, upscale_method, max_bytes, min_psnr)
+        return self.work_key(image_data, mode, upscale_method, max_bytes, min_psnr)
+    
+    def lane_for(self, upscale_method: str) -> Lane:
+        """処理を実行するレーン（AIが利用できない場合のAIアップスケールは単純アップスケールになるため単純レーン）"""
+        if upscale_method == "ai" and self._ai_available:
+            return self.lanes["ai"]
+        return self.lanes["simple"]
+    
+    def lane_metrics(self) -> dict:
+        """レーンごとのキュー・処理数の統計"""
+        return {name: lane.metrics() for name, lane in self.lanes.items()}
+    
     async def process_image(
         self,
         image_data: bytes,
         mode: Literal["vertical", "horizontal"],
-        upscale_method: Literal["simple", "ai"]
-    ) -> bytes:
+        upscale_method: Literal["simple", "enhance", "ai"],
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None,
+        key: Optional[str] = None,
+        priority: int = PRIORITY_NORMAL
+    ) -> EncodedImage:
         """
         画像を処理します。
         
+        同じ内容・設定の処理が実行中の場合は、新たに処理せずその結果を共有します。
+        
         Args:
             image_data: 画像のバイトデータ
             mode: リサイズモード（"vertical" または "horizontal"）
-            upscale_method: アップスケール方法（"simple" または "ai"）
+            upscale_method: アップスケール方法（"simple"、"enhance" または "ai"）
+            max_bytes: 出力サイズの上限（指定時はJPEGの品質を自動で選択）
+            min_psnr: 画質の下限（PSNR, dB。指定時はJPEGの品質を自動で選択）
+            key: work_key() で計算済みのキー（省略時はここで計算）
+            priority: レーン内での優先度（app.services.lanes の PRIORITY_*）
         
         Returns:
-            処理済み画像のバイトデータ
+            処理済み画像
         """
-        # 同期的な処理を非同期で実行
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self.executor,
+        if key is None:
+            key = await self.work_key_async(image_data, mode, upscale_method, max_bytes, min_psnr)
+        
+        # 同期的な処理を処理の種類に応じたレーンで実行
+        lane = self.lane_for(upscale_method)
+        return await self._single_flight.do(key, lambda: lane.submit(
             self._process_image_sync,
             image_data,
             mode,
-            upscale_method
-        )
+            upscale_method,
+            max_bytes,
+            min_psnr,
+            priority=priority
+        ))
     
     def _process_image_sync(
         self,
-        image_data: bytes,
+        image_data: Union[bytes, BinaryIO],
         mode: Literal["vertical", "horizontal"],
-        upscale_method: Literal["simple", "ai"]
-    ) -> bytes:
-        """同期的な画像処理"""
-        try:
-            # 画像を開く
-            image = Image.open(io.BytesIO(image_data))
-            
-            # 画像が正常に読み込めたか確認
-            image.verify()
-            
-            # verify()は画像を閉じるので、再度開く必要がある
-            image = Image.open(io.BytesIO(image_data))
-        except Exception as e:
-            raise ValueError(f"画像ファイルを読み込めませんでした: {str(e)}")
-        
-        # RGBに変換（RGBAやPモードなどに対応）
-        try:
-            if image.mode != "RGB":
-                if image.mode == "RGBA":
-                    # 透明部分を白で塗りつぶし
-                    background = Image.new("RGB", image.size, (255, 255, 255))
-                    background.paste(image, mask=image.split()[3] if image.mode == "RGBA" else None)
-                    image = background
-                else:
-                    image = image.convert("RGB")
-        except Exception as e:
-            raise ValueError(f"画像の色空間変換に失敗しました: {str(e)}")
-        
+        upscale_method: Literal["simple", "enhance", "ai"],
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None
+    ) -> EncodedImage:
+        """
+        同期的な画像処理
+
+        image_dataにはシーク可能なファイルも渡せます。巨大な非圧縮画像は全体を読み込まずに
+        帯ごとに処理し、それ以外の画像は読み込んでから通常の方法で処理します。
+        """
         # ターゲットサイズを決定
         target_size = self.VERTICAL_SIZE if mode == "vertical" else self.HORIZONTAL_SIZE
-        logger.info(f"モード: {mode}, ターゲットサイズ: {target_size}")
         
-        # リサイズ
         try:
-            resized_image = self._resize_to_target(image, target_size)
-            # 確実にターゲットサイズになっているか確認
-            if resized_image.size != target_size:
-                logger.warning(f"リサイズ後のサイズが期待と異なります: {resized_image.size} != {target_size}。再リサイズします。")
-                resized_image = resized_image.resize(target_size, Image.Resampling.LANCZOS)
+            # 巨大な画像は全体を展開せず、帯ごとに読み込んでターゲットサイズに縮小
+            large = self.strip_resizer.resize(image_data, target_size)
         except Exception as e:
-            raise ValueError(f"画像のリサイズに失敗しました: {str(e)}")
+            raise ValueError(f"画像ファイルを読み込めませんでした: {str(e)}")
+        
+        # 処理段階ごとの詳細ログはサンプリングしたリクエストのみ出力
+        trace = stage_sampled()
+        if trace:
+            logger.info("モード: %s, ターゲットサイズ: %s", mode, target_size, extra={"stage": "start"})
+        
+        if large is not None:
+            resized_image, source_size = large
+            if trace:
+                logger.info("巨大な画像のため帯ごとに縮小しました: 元のサイズ=%s", source_size, extra={"stage": "resize"})
+        else:
+            if not isinstance(image_data, (bytes, bytearray)):
+                image_data.seek(0)
+                image_data = image_data.read()
+            resized_image, source_size = self._decode_and_resize(image_data, target_size, trace)
         
         # アップスケール
         try:
             if upscale_method == "ai":
                 upscaled_image = self._upscale_ai(resized_image, target_size)
+            elif upscale_method == "enhance":
+                upscaled_image = self._upscale_enhance(resized_image, source_size)
             else:
                 upscaled_image = self._upscale_simple(resized_image)
         except Exception as e:
@@ -103,94 +185,86 @@ class ImageProcessor:
         
         # 最終的に確実にターゲットサイズになっているか確認
         if upscaled_image.size != target_size:
-            logger.warning(f"アップスケール後のサイズが期待と異なります: {upscaled_image.size} != {target_size}。再リサイズします。")
+            logger.warning("アップスケール後のサイズが期待と異なります: %s != %s。再リサイズします。", upscaled_image.size, target_size)
             upscaled_image = upscaled_image.resize(target_size, Image.Resampling.LANCZOS)
         
+        # 出力サイズの上限・画質の下限が指定された場合は、試し圧縮で品質を選択
+        quality = choose_quality(upscaled_image, max_bytes, min_psnr, default=self.OUTPUT_QUALITY)
+        if trace and quality != self.OUTPUT_QUALITY:
+            logger.info("JPEG品質を選択: quality=%d (max_bytes=%s, min_psnr=%s)", quality, max_bytes, min_psnr, extra={"stage": "encode"})
+        
         # バイトデータに変換
         try:
-            output = io.BytesIO()
-            upscaled_image.save(output, format="JPEG", quality=95)
-            output.seek(0)
-            return output.read()
+            data = self.codecs.encode(upscaled_image, format=self.OUTPUT_FORMAT, quality=quality)
+            return EncodedImage(data=data, quality=quality)
         except Exception as e:
             raise ValueError(f"画像の保存に失敗しました: {str(e)}")
     
-    def _resize_to_target(self, image: Image.Image, target_size: tuple[int, int]) -> Image.Image:
+    def _decode_and_resize(
+        self,
+        image_data: bytes,
+        target_size: tuple[int, int],
+        trace: bool = False
+    ) -> tuple[Image.Image, tuple[int, int]]:
+        """画像をデコードしてターゲットサイズにリサイズし、(リサイズ後の画像, 元画像のサイズ) を返します。"""
+        try:
+            # 画像を開く（フォーマットに応じてPillowまたはOpenCVでデコード）
+            image = self.codecs.decode(image_data, target_size)
+        except Exception as e:
+            raise ValueError(f"画像ファイルを読み込めませんでした: {str(e)}")
+        
+        source_size = image.size
+        
+        # RGBに変換（RGBAやPモードなどに対応、透明部分は白で塗りつぶし）
+        try:
+            image = to_rgb(image)
+        except Exception as e:
+            raise ValueError(f"画像の色空間変換に失敗しました: {str(e)}")
+        
+        # リサイズ
+        try:
+            resized_image = self._resize_to_target(image, target_size, trace=trace)
+            # 確実にターゲットサイズになっているか確認
+            if resized_image.size != target_size:
+                logger.warning("リサイズ後のサイズが期待と異なります: %s != %s。再リサイズします。", resized_image.size, target_size)
+                resized_image = resized_image.resize(target_size, Image.Resampling.LANCZOS)
+        except Exception as e:
+            raise ValueError(f"画像のリサイズに失敗しました: {str(e)}")
+        
+        return resized_image, source_size
+    
+    def _resize_to_target(
+        self,
+        image: Image.Image,
+        target_size: tuple[int, int],
+        trace: bool = False
+    ) -> Image.Image:
         """
         画像を指定サイズにリサイズします。
         アスペクト比を維持しつつ、必要に応じてクロップを行います。
         余白を含まないように、確実にターゲットサイズにクロップします。
         最終的に確実にtarget_sizeのサイズになります。
+        
+        trace=True の場合は処理段階ごとの詳細ログを出力します。
         """
-        target_width, target_height = target_size
-        original_width, original_height = image.size
-        
-        logger.info(f"リサイズ開始: 元のサイズ={image.size}, ターゲットサイズ={target_size}")
-        
-        # アスペクト比を計算
-        target_aspect = target_width / target_height
-        original_aspect = original_width / original_height
-        
-        logger.info(f"アスペクト比: 元={original_aspect:.3f}, ターゲット={target_aspect:.3f}")
-        
-        if abs(original_aspect - target_aspect) < 0.001:
-            # アスペクト比がほぼ同じ場合、直接リサイズ
-            logger.info("アスペクト比が同じため、直接リサイズします")
-            resized = image.resize(target_size, Image.Resampling.LANCZOS)
-            return resized
-        
-        if original_aspect > target_aspect:
-            # 元の画像がターゲットより横長 → 幅をターゲット幅に合わせてリサイズし、高さをクロップ
-            # 余白を避けるため、ターゲット幅に合わせる
-            scale_factor = target_width / original_width
-            new_width = target_width
-            new_height = int(original_height * scale_factor)
-            logger.info(f"横長画像: スケール={scale_factor:.3f}, リサイズサイズ=({new_width}, {new_height})")
-            
-            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 高さがターゲットより大きい場合、中央でクロップ（余白を避ける）
-            if new_height >= target_height:
-                crop_top = (new_height - target_height) // 2
-                cropped = resized.crop((0, crop_top, target_width, crop_top + target_height))
-                logger.info(f"高さをクロップ: crop_top={crop_top}, 結果サイズ={cropped.size}")
-            else:
-                # 高さが足りない場合は、幅を拡大してからクロップ
-                logger.warning(f"高さが足りません: {new_height} < {target_height}。再計算します。")
-                scale_factor = target_height / original_height
-                new_height = target_height
-                new_width = int(original_width * scale_factor)
-                resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                crop_left = (new_width - target_width) // 2
-                cropped = resized.crop((crop_left, 0, crop_left + target_width, target_height))
-                logger.info(f"幅をクロップ: crop_left={crop_left}, 結果サイズ={cropped.size}")
-        else:
-            # 元の画像がターゲットより縦長 → 高さをターゲット高さに合わせてリサイズし、幅をクロップ
-            # 余白を避けるため、ターゲット高さに合わせる
-            scale_factor = target_height / original_height
-            new_height = target_height
-            new_width = int(original_width * scale_factor)
-            logger.info(f"縦長画像: スケール={scale_factor:.3f}, リサイズサイズ=({new_width}, {new_height})")
-            
-            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 幅がターゲットより大きい場合、中央でクロップ（余白を避ける）
-            if new_width >= target_width:
-                crop_left = (new_width - target_width) // 2
-                cropped = resized.crop((crop_left, 0, crop_left + target_width, target_height))
-                logger.info(f"幅をクロップ: crop_left={crop_left}, 結果サイズ={cropped.size}")
-            else:
-                # 幅が足りない場合は、高さを拡大してからクロップ
-                logger.warning(f"幅が足りません: {new_width} < {target_width}。再計算します。")
-                scale_factor = target_width / original_width
-                new_width = target_width
-                new_height = int(original_height * scale_factor)
-                resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                crop_top = (new_height - target_height) // 2
-                cropped = resized.crop((0, crop_top, target_width, crop_top + target_height))
-                logger.info(f"高さをクロップ: crop_top={crop_top}, 結果サイズ={cropped.size}")
-        
-        logger.info(f"リサイズ完了: 最終サイズ={cropped.size}, ターゲット={target_size}")
+        if trace:
+            logger.info("リサイズ開始: 元のサイズ=%s, ターゲットサイズ=%s", image.size, target_size, extra={"stage": "resize"})
+        
+        # 余白なしで覆うサイズとクロップ位置（帯ごとの縮小と同じ cover_geometry を使用）
+        (new_width, new_height), (crop_left, crop_top) = cover_geometry(image.size, target_size)
+        if trace:
+            logger.info(
+                "リサイズサイズ=(%d, %d), クロップ位置=(%d, %d)", new_width, new_height, crop_left, crop_top,
+                extra={"stage": "resize"}
+            )
+        
+        cropped = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        if cropped.size != target_size:
+            # 中央でクロップ（余白を避ける）
+            cropped = cropped.crop((crop_left, crop_top, crop_left + target_size[0], crop_top + target_size[1]))
+        
+        if trace:
+            logger.info("リサイズ完了: 最終サイズ=%s, ターゲット=%s", cropped.size, target_size, extra={"stage": "resize"})
         
         # 最終確認 - サイズが一致しない場合はエラー
         if cropped.size != target_size:
@@ -206,8 +280,69 @@ class ImageProcessor:
         # 将来的にさらにアップスケールする場合はここで処理
         return image
     
+    def _upscale_enhance(self, image: Image.Image, source_size: tuple[int, int]) -> Image.Image:
+        """
+        AIを使わない高速な高画質化（元画像が規定サイズより小さい場合）
+        
+        LANCZOSで拡大済みの画像に対し、輝度のみにエッジ適応型のアンシャープマスクをかけます。
+        平坦部（ノイズやブロックノイズ）は強調せず、エッジ付近のみシャープにし、
+        周囲の最小・最大値でクリップしてハロー（縁取り）を抑えます。
+        
+        Args:
+            image: リサイズ済みの画像
+            source_size: 元画像のサイズ（拡大率の算出に使用）
+        """
+        import cv2
+        
+        target_width, target_height = image.size
+        scale = max(target_width / source_size[0], target_height / source_size[1])
+        if scale <= 1.0:
+            # 縮小した画像は十分な解像度があるため、そのまま返す
+            return image
+        
+        ycrcb = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2YCrCb)
+        luma = ycrcb[:, :, 0].astype(np.float32)
+        
+        # 拡大率が大きいほどぼけが広がるため、ぼかし半径と強さを大きくする
+        sigma = float(np.clip(0.5 * scale, 0.8, 2.5))
+        amount = float(np.clip(0.6 + 0.3 * np.log2(scale), 0.6, 1.5))
+        blurred = cv2.GaussianBlur(luma, (0, 0), sigma)
+        detail = luma - blurred
+        
+        # エッジの強さに応じた重み（平坦部は0に近づく）
+        grad_x = cv2.Sobel(blurred, cv2.CV_32F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(blurred, cv2.CV_32F, 0, 1, ksize=3)
+        magnitude = cv2.magnitude(grad_x, grad_y)
+        weight = magnitude / (magnitude + 16.0)
+        
+        sharpened = luma + amount * weight * detail
+        
+        # ハロー抑制: 3x3近傍の最小・最大値を少し超える範囲に制限
+        kernel = np.ones((3, 3), np.uint8)
+        local_max = cv2.dilate(luma, kernel) + 4.0
+        local_min = cv2.erode(luma, kernel) - 4.0
+        np.clip(sharpened, local_min, local_max, out=sharpened)
+        
+        ycrcb[:, :, 0] = np.clip(sharpened, 0, 255).astype(np.uint8)
+        return Image.fromarray(cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2RGB))
+    
     def _check_ai_availability(self):
         """AIアップスケーラーの利用可能性をチェック"""
+        if self.ai_backend == "onnx":
+            model_path = os.getenv("AI_ONNX_MODEL_PATH", "")
+            try:
+                import onnxruntime
+            except ImportError:
+                self._ai_available = False
+                logger.warning("onnxruntimeがインストールされていません。AIアップスケールは利用できません。")
+                return
+            self._ai_available = os.path.isfile(model_path)
+            if self._ai_available:
+                logger.info("ONNX Runtimeが利用可能です: %s", model_path)
+            else:
+                logger.warning("ONNXモデルが見つかりません（AI_ONNX_MODEL_PATH=%s）。AIアップスケールは利用できません。", model_path)
+            return
+        
         try:
             import realesrgan
             self._ai_available = True
@@ -216,25 +351,50 @@ class ImageProcessor:
             self._ai_available = False
             logger.warning("Real-ESRGANがインストールされていません。AIアップスケールは利用できません。")
     
+    def preload_ai_model(self) -> bool:
+        """
+        AIモデルを事前に読み込みます。
+
+        gunicornのpreload_appと組み合わせてフォーク前の親プロセスで呼び出すと、
+        モデルの重みがワーカー間でコピーオンライトにより共有されます。
+        親プロセスでは推論を実行しないでください（スレッドプールがフォーク後に壊れるため）。
+
+        Returns:
+            モデルを読み込めた場合はTrue
+        """
+        if not self._ai_available:
+            logger.warning("AIアップスケーラーが利用できないため、AIモデルの事前読み込みをスキップします")
+            return False
+        try:
+            self._init_ai_upscaler()
+            return True
+        except Exception:
+            return False
+    
     def _init_ai_upscaler(self):
         """AIアップスケーラーを初期化（遅延初期化）"""
         if not self._ai_available:
-            raise ImportError("Real-ESRGANが利用できません")
+            raise ImportError("AIアップスケーラーが利用できません")
         
         if self._ai_upscaler is not None:
             return self._ai_upscaler
         
+        if self.ai_backend == "onnx":
+            return self._init_onnx_upscaler()
+        
         try:
+            from basicsr.archs.rrdbnet_arch import RRDBNet
             from realesrgan import RealESRGANer
-            import cv2
             
             # Real-ESRGANのモデルを初期化
-            # 一般的な画像用のモデルを使用
+            # 一般的な画像用のモデル（RealESRGAN_x4plus）のネットワーク構造。重みは model_path から読み込む
+            model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
             upsampler = RealESRGANer(
                 scale=4,  # 4倍アップスケール
-                model_path='https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth',
-                model=None,  # モデルは自動的にダウンロードされる
-                tile=0,
+                # URLの場合は初回にダウンロードしてキャッシュされる
+                model_path=os.getenv("AI_MODEL_PATH", self.REALESRGAN_WEIGHTS_URL),
+                model=model,
+                tile=int(os.getenv("AI_TILE", "0")),
                 tile_pad=10,
                 pre_pad=0,
                 half=False  # CPUの場合はFalse
@@ -244,13 +404,31 @@ class ImageProcessor:
             logger.info("AIアップスケーラーを初期化しました")
             return upsampler
         except Exception as e:
-            logger.error(f"AIアップスケーラーの初期化に失敗しました: {e}")
+            logger.error("AIアップスケーラーの初期化に失敗しました: %s", e)
+            self._ai_available = False
+            raise
+    
+    def _init_onnx_upscaler(self):
+        """ONNX RuntimeのAIアップスケーラーを初期化"""
+        try:
+            from app.services.onnx_upscaler import OnnxUpscaler
+            
+            upsampler = OnnxUpscaler(
+                model_path=os.getenv("AI_ONNX_MODEL_PATH", ""),
+                intra_op_threads=int(os.getenv("AI_ONNX_THREADS", "0")),
+                tile=int(os.getenv("AI_TILE", "0"))
+            )
+            self._ai_upscaler = upsampler
+            logger.info("AIアップスケーラー（ONNX Runtime）を初期化しました")
+            return upsampler
+        except Exception as e:
+            logger.error("AIアップスケーラーの初期化に失敗しました: %s", e)
             self._ai_available = False
             raise
     
     def _upscale_ai(self, image: Image.Image, target_size: tuple[int, int]) -> Image.Image:
         """
-        AIベースのアップスケール（Real-ESRGANを使用）
+        AIベースのアップスケール（Real-ESRGANまたはONNX Runtimeを使用）
         
         Args:
             image: リサイズ済みの画像
@@ -291,6 +469,6 @@ class ImageProcessor:
             return self._upscale_simple(image)
         except Exception as e:
             # エラーが発生した場合は単純リサイズにフォールバック
-            logger.error(f"AIアップスケールエラー: {e}", exc_info=True)
+            logger.error("AIアップスケールエラー: %s", e, exc_info=True)
             return self._upscale_simple(image)
 
@@ -0,0 +1,116 @@
+"""
+JPEGの品質（quality）の自動選択
+
+出力サイズの上限（バイト数）または画質の下限（PSNR）を満たす品質を、
+画像の一部を切り出したサンプルの試し圧縮で二分探索し、最終的な圧縮は1回だけ行います。
+
+サンプルは16行単位（4:2:0のMCUの高さ）の帯を一定間隔で切り出して繋げたもので、
+ブロックの内容が元画像と同じになるため、1画素あたりのバイト数とPSNRを偏りなく推定できます。
+"""
+from PIL import Image, ImageChops, ImageStat
+import io
+import math
+from typing import Optional
+
+# 品質の探索範囲
+MIN_QUALITY = 40
+MAX_QUALITY = 95
+# サンプルの帯の高さと間隔（元画像の1/4の行を使用）
+_BAND_HEIGHT = 32
+_BAND_PERIOD = 128
+# 推定誤差を見込んで、上限より少し小さいサイズを目標にする
+_BUDGET_MARGIN = 0.95
+
+
+def _sample(image: Image.Image) -> Image.Image:
+    """一定間隔の帯を切り出して繋げたサンプル画像"""
+    if image.height < _BAND_PERIOD * 2:
+        return image
+    tops = range(0, image.height - _BAND_HEIGHT + 1, _BAND_PERIOD)
+    sample = Image.new(image.mode, (image.width, _BAND_HEIGHT * len(tops)))
+    for i, top in enumerate(tops):
+        sample.paste(image.crop((0, top, image.width, top + _BAND_HEIGHT)), (0, i * _BAND_HEIGHT))
+    return sample
+
+
+def _encode(image: Image.Image, quality: int) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def psnr(reference: Image.Image, encoded: bytes) -> float:
+    """圧縮前の画像と圧縮後のJPEGのPSNR（dB）"""
+    decoded = Image.open(io.BytesIO(encoded)).convert(reference.mode)
+    stat = ImageStat.Stat(ImageChops.difference(reference, decoded))
+    pixels = reference.width * reference.height
+    mse = sum(stat.sum2) / (pixels * len(stat.sum2))
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+class _Estimator:
+    """サンプルの試し圧縮から、元画像を圧縮した場合のサイズとPSNRを推定"""
+
+    def __init__(self, image: Image.Image):
+        self.sample = _sample(image)
+        self.ratio = (image.width * image.height) / (self.sample.width * self.sample.height)
+        self._cache: dict[int, bytes] = {}
+
+    def _trial(self, quality: int) -> bytes:
+        if quality not in self._cache:
+            self._cache[quality] = _encode(self.sample, quality)
+        return self._cache[quality]
+
+    def size(self, quality: int) -> float:
+        # ヘッダー（量子化テーブル・ハフマンテーブル）は画像の大きさによらないため比例させない
+        header = len(_encode(Image.new(self.sample.mode, (16, 16)), quality))
+        return header + (len(self._trial(quality)) - header) * self.ratio
+
+    def psnr(self, quality: int) -> float:
+        return psnr(self.sample, self._trial(quality))
+
+
+def _search(low: int, high: int, accept) -> Optional[int]:
+    """accept(q) が単調（qが大きいほど満たしやすい）な場合に、満たす最小のqを返す"""
+    found = None
+    while low <= high:
+        mid = (low + high) // 2
+        if accept(mid):
+            found, high = mid, mid - 1
+        else:
+            low = mid + 1
+    return found
+
+
+def choose_quality(
+    image: Image.Image,
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None,
+    default: int = MAX_QUALITY
+) -> int:
+    """
+    出力サイズの上限・画質の下限を満たすJPEGの品質を選択します。
+
+    - min_psnr: PSNRが下限以上になる最小の品質（サイズが最も小さくなる）
+    - max_bytes: サイズが上限以下になる最大の品質
+    - 両方指定した場合は小さい方（サイズの上限を優先）
+    - どちらも指定しない場合は default
+
+    サイズの上限を満たせない場合は MIN_QUALITY を返します。
+    """
+    if max_bytes is None and min_psnr is None:
+        return default
+
+    estimator = _Estimator(image)
+    quality = MAX_QUALITY
+    if min_psnr is not None:
+        quality = _search(MIN_QUALITY, MAX_QUALITY, lambda q: estimator.psnr(q) >= min_psnr) or MAX_QUALITY
+    if max_bytes is not None:
+        budget = max_bytes * _BUDGET_MARGIN
+        # サイズは品質が大きいほど増えるため、上限を超える最小の品質の1つ下を求める
+        over = _search(MIN_QUALITY, MAX_QUALITY, lambda q: estimator.size(q) > budget)
+        fits = MAX_QUALITY if over is None else max(over - 1, MIN_QUALITY)
+        quality = min(quality, fits)
+    return quality
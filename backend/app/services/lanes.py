@@ -0,0 +1,167 @@
+"""
+処理の種類ごとの実行レーン
+
+数百ミリ秒で終わる単純リサイズと、数秒〜数分かかるAIアップスケールを別々のスレッドで実行し、
+AIの処理が詰まっても単純リサイズが待たされないようにします。
+
+各レーンは優先度付きのキューと専用のワーカースレッドを持ち、キューの長さや待ち時間を個別に計測します。
+キューが上限に達したレーンへの新しいリクエストは LaneFullError で拒否します（APIでは429を返す）。
+
+設定（環境変数、<NAME> はレーン名の大文字）:
+- <NAME>_LANE_WORKERS: ワーカースレッド数（同時に実行する処理数）
+- <NAME>_LANE_MAX_QUEUE: 実行待ちの上限（0は無制限）
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# 優先度（小さいほど先に実行）
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# 待ち時間・実行時間の統計に使う直近の処理数
+_RECENT_SAMPLES = 256
+
+
+class LaneFullError(RuntimeError):
+    """レーンの実行待ちが上限に達している場合の例外"""
+
+    def __init__(self, lane: str):
+        super().__init__(f"{lane}レーンが混雑しています")
+        self.lane = lane
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """最近傍順位法によるパーセンタイル（sorted_valuesは昇順、pは0〜100。負荷試験ハーネスと共通）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class Lane:
+    """優先度付きキューと専用のワーカースレッドを持つ実行レーン"""
+
+    def __init__(self, name: str, workers: int, max_queue: int = 0):
+        self.name = name
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._threads_pid = None
+        self._queued = 0
+        self._running = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        self._wait_times: deque = deque(maxlen=_RECENT_SAMPLES)
+        self._run_times: deque = deque(maxlen=_RECENT_SAMPLES)
+
+    @classmethod
+    def from_env(cls, name: str, workers: int, max_queue: int = 0) -> "Lane":
+        prefix = name.upper()
+        return cls(
+            name,
+            workers=int(os.getenv(f"{prefix}_LANE_WORKERS", str(workers))),
+            max_queue=int(os.getenv(f"{prefix}_LANE_MAX_QUEUE", str(max_queue)))
+        )
+
+    def _ensure_threads(self):
+        """
+        ワーカースレッドを起動します（最初の投入時）。
+        gunicornのpreload_appでフォークした子プロセスにはスレッドが引き継がれないため、プロセスごとに起動します。
+        """
+        pid = os.getpid()
+        if self._threads_pid == pid:
+            return
+        with self._lock:
+            if self._threads_pid == pid:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._worker, name=f"lane-{self.name}-{i}", daemon=True).start()
+            self._threads_pid = pid
+
+    def admit(self):
+        """
+        新しいリクエストを受け付けられるか確認します。
+
+        Raises:
+            LaneFullError: 実行待ちが上限に達している場合
+        """
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise LaneFullError(self.name)
+
+    def estimated_wait(self) -> int:
+        """現在の実行待ちがすべて終わるまでの目安（秒、Retry-Afterヘッダー用）"""
+        with self._lock:
+            queued = self._queued
+            run_time = percentile(sorted(self._run_times), 50)
+        return max(math.ceil(queued * run_time / self.workers), 1)
+
+    def submit(self, func: Callable[..., T], *args, priority: int = PRIORITY_NORMAL) -> "asyncio.Future[T]":
+        """
+        処理をキューに追加し、結果を待つasyncioのFutureを返します。
+        実行前にFutureがキャンセルされた場合、その処理は実行しません。
+        """
+        self._ensure_threads()
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            self._queued += 1
+            self._counters["submitted"] += 1
+        self._queue.put((priority, next(self._sequence), (future, func, args, time.perf_counter())))
+        return asyncio.wrap_future(future)
+
+    def _worker(self):
+        while True:
+            _, _, (future, func, args, enqueued) = self._queue.get()
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                if not future.set_running_or_notify_cancel():
+                    self._counters["cancelled"] += 1
+                    continue
+                self._running += 1
+                self._wait_times.append(started - enqueued)
+            result = error = None
+            try:
+                result = func(*args)
+            except BaseException as e:
+                error = e
+            # 統計は結果を返す前に更新する（結果を受け取った直後の metrics() に反映されるように）
+            with self._lock:
+                self._running -= 1
+                self._counters["failed" if error else "completed"] += 1
+                self._run_times.append(time.perf_counter() - started)
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+            del result, error
+
+    def metrics(self) -> dict:
+        """キューの長さ・処理数・待ち時間などの統計"""
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            run_times = sorted(self._run_times)
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                **self._counters,
+                "wait_ms_p50": round(percentile(wait_times, 50) * 1000, 1),
+                "wait_ms_p95": round(percentile(wait_times, 95) * 1000, 1),
+                "run_ms_p50": round(percentile(run_times, 50) * 1000, 1),
+                "run_ms_p95": round(percentile(run_times, 95) * 1000, 1),
+            }
@@ -0,0 +1,115 @@
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+from typing import Optional
+
+
+class MultipartStreamError(ValueError):
+    """multipart/form-dataとして解析できない場合のエラー"""
+
+
+class StreamingMultipartParser:
+    """
+    multipart/form-dataのリクエストボディをチャンク単位で解析します。
+
+    feed()にチャンクを渡すと、その時点で受信が完了したパートを返します。
+    メモリに保持するのは受信中のパート1つ分のみで、max_part_sizeを超えたパートは
+    データを破棄して error を設定します。
+    """
+
+    def __init__(self, content_type: str, max_part_size: int):
+        media_type, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise MultipartStreamError("multipart/form-data形式で送信してください")
+
+        self.max_part_size = max_part_size
+        self._completed: list[dict] = []
+        self._current: Optional[dict] = None
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._headers: dict[bytes, bytes] = {}
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        """
+        チャンクを解析し、受信が完了したパートのリストを返します。
+
+        各パートは {"name", "filename", "content_type", "data", "error"} の辞書です
+        （dataはコピーを避けるためbytearrayのまま返します）。
+
+        Raises:
+            MultipartStreamError: ボディがmultipart/form-dataとして不正な場合
+        """
+        if chunk:
+            try:
+                self._parser.write(chunk)
+            except MultipartParseError as e:
+                raise MultipartStreamError(f"multipart/form-dataの解析に失敗しました: {e}") from e
+        completed, self._completed = self._completed, []
+        return completed
+
+    def finalize(self) -> list[dict]:
+        """ボディの終端で呼び出し、残りのパートを返します。"""
+        try:
+            self._parser.finalize()
+        except MultipartParseError as e:
+            raise MultipartStreamError(f"multipart/form-dataの解析に失敗しました: {e}") from e
+        completed, self._completed = self._completed, []
+        return completed
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._current = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        content_type = self._headers.get(b"content-type")
+        self._current = {
+            "name": options.get(b"name", b"").decode("utf-8", errors="replace"),
+            "filename": filename.decode("utf-8", errors="replace") if filename is not None else None,
+            "content_type": content_type.decode("latin-1") if content_type else None,
+            "data": bytearray(),
+            "error": None,
+        }
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._current
+        if part is None or part["error"]:
+            return
+        if len(part["data"]) + (end - start) > self.max_part_size:
+            # 上限を超えたパートは以降のデータを破棄
+            part["data"] = None
+            part["error"] = "too_large"
+            return
+        part["data"] += data[start:end]
+
+    def _on_part_end(self):
+        part = self._current
+        if part is None:
+            return
+        self._completed.append(part)
+        self._current = None
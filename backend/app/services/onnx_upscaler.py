@@ -0,0 +1,108 @@
+"""
+ONNX RuntimeによるAIアップスケーラー（CPU向け）
+
+Real-ESRGANをONNX形式にエクスポートしたモデル（int8量子化済みも可）を
+ONNX RuntimeのCPUプロバイダーで実行します。RealESRGANerと同じ enhance() を提供するため、
+ImageProcessor._upscale_ai からはバックエンドを意識せずに利用できます。
+
+モデルの入出力はNCHW・RGB・0〜1の値を想定しています（app.tools.export_onnx で作成）。
+"""
+import logging
+import math
+import os
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class OnnxUpscaler:
+    def __init__(
+        self,
+        model_path: str,
+        intra_op_threads: int = 0,
+        tile: int = 0,
+        tile_pad: int = 10
+    ):
+        """
+        Args:
+            model_path: ローカルのONNXモデルファイル
+            intra_op_threads: 演算内の並列スレッド数（0の場合はONNX Runtimeの既定値）
+            tile: タイル分割のサイズ（0の場合は分割しない）。大きな画像のメモリ使用量を抑えます
+            tile_pad: タイル境界の継ぎ目を防ぐためのパディング
+        """
+        import onnxruntime as ort
+
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"ONNXモデルが見つかりません: {model_path}")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        self.tile = tile
+        self.tile_pad = tile_pad
+        self.scale: Optional[int] = None
+        logger.info("ONNXモデルを読み込みました: %s (threads=%d)", model_path, intra_op_threads)
+
+    def _run(self, rgb: np.ndarray) -> np.ndarray:
+        """HWC・uint8のRGB配列を推論し、HWC・float32（0〜1）で返す"""
+        tensor = np.ascontiguousarray(rgb.transpose(2, 0, 1)[None], dtype=self.input_dtype)
+        tensor /= 255
+        output = self.session.run(None, {self.input_name: tensor})[0][0]
+        if self.scale is None:
+            self.scale = output.shape[1] // rgb.shape[0]
+        return output.transpose(1, 2, 0).astype(np.float32, copy=False)
+
+    def _run_tiled(self, rgb: np.ndarray) -> np.ndarray:
+        """タイルに分割して推論（パディング部分は結果から切り落とす）"""
+        height, width = rgb.shape[:2]
+        tile, pad = self.tile, self.tile_pad
+        output = None
+        for ty in range(math.ceil(height / tile)):
+            for tx in range(math.ceil(width / tile)):
+                x0, y0 = tx * tile, ty * tile
+                x1, y1 = min(x0 + tile, width), min(y0 + tile, height)
+                px0, py0 = max(x0 - pad, 0), max(y0 - pad, 0)
+                px1, py1 = min(x1 + pad, width), min(y1 + pad, height)
+                result = self._run(rgb[py0:py1, px0:px1])
+                scale = self.scale
+                if output is None:
+                    output = np.empty((height * scale, width * scale, 3), dtype=np.float32)
+                output[y0 * scale:y1 * scale, x0 * scale:x1 * scale] = result[
+                    (y0 - py0) * scale:(y1 - py0) * scale,
+                    (x0 - px0) * scale:(x1 - px0) * scale,
+                ]
+        return output
+
+    def enhance(self, img: np.ndarray, outscale: Optional[float] = None) -> tuple[np.ndarray, None]:
+        """
+        RealESRGANer.enhance() と同じインターフェースでアップスケールします。
+
+        Args:
+            img: BGR・uint8の画像
+            outscale: 最終的な拡大率（モデルの倍率と異なる場合はリサイズ）
+        """
+        import cv2
+
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if self.tile > 0 and max(rgb.shape[:2]) > self.tile:
+            output = self._run_tiled(rgb)
+        else:
+            output = self._run(rgb)
+        output = (np.clip(output, 0, 1) * 255).round().astype(np.uint8)
+        output = cv2.cvtColor(output, cv2.COLOR_RGB2BGR)
+
+        if outscale is not None and outscale != self.scale:
+            height, width = img.shape[:2]
+            output = cv2.resize(
+                output,
+                (int(width * outscale), int(height * outscale)),
+                interpolation=cv2.INTER_LANCZOS4
+            )
+        return output, None
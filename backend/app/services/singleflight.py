@@ -0,0 +1,36 @@
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中であれば、新たに実行せずその結果を共有します。
+
+    結果はキャッシュしません（処理が完了した時点でキーは解放されます）。
+    呼び出し元の1つがキャンセルされても、処理と他の呼び出し元には影響しません。
+    """
+
+    def __init__(self):
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """実行中の処理数"""
+        return len(self._in_flight)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._release(key, f))
+        return await asyncio.shield(future)
+
+    def _release(self, key: str, future: asyncio.Future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        # 呼び出し元がすべてキャンセルされた場合でも例外が未取得のまま残らないようにする
+        if not future.cancelled():
+            future.exception()
@@ -0,0 +1,307 @@
+"""
+巨大な画像の省メモリな縮小
+
+パノラマやスキャン画像などの巨大な画像を、元の解像度のまま全体を展開せずに
+ターゲットサイズへ縮小します。メモリ使用量は元画像ではなく出力サイズに比例します。
+
+- JPEG: デコード時に1/2〜1/8へ縮小（draft）してから縮小
+- 非圧縮の画像（TIFF・BMP・PPM・TGAなど）: 横長の帯（ストリップ）ごとに読み込み、
+  クロップ後に残る範囲だけを出力の解像度へリサンプリング
+- それ以外（PNG・WebP・圧縮TIFFなど）: 途中から読み込めないため対象外（通常の処理を使用）
+
+非圧縮の画像は入力がそのまま画素数に比例する大きさになるため、バイト列ではなく
+シーク可能なファイルを渡すと、入力全体もメモリに読み込まずに処理できます（一括処理CLI）。
+APIはアップロードをメモリに受け取り、ファイルサイズの上限（50MB）があるため、
+APIで対象になるのは実質的に巨大なJPEGのみです。
+
+Pillowは MAX_IMAGE_PIXELS（約1.8億画素）を超える画像を DecompressionBombError で拒否しますが、
+この経路では全体を展開しないため、代わりに STRIP_RESIZE_MAX_PIXELS で上限を設定します。
+
+設定（環境変数）:
+- LARGE_IMAGE_PIXELS: この画素数以上の画像を対象にする（デフォルト: 40000000, 0で無効）
+- STRIP_RESIZE_MAX_PIXELS: この経路で受け付ける画素数の上限（デフォルト: 1000000000, 0で無制限）
+- STRIP_RESIZE_BUDGET_MB: 1つの帯に使うメモリの目安（デフォルト: 32）
+"""
+from PIL import Image
+import io
+import logging
+import math
+import os
+import struct
+from typing import BinaryIO, Optional, Union
+
+from app.services.codecs import _reduction_factor
+
+logger = logging.getLogger(__name__)
+
+# LANCZOSのサポート半径（出力1画素あたりの入力画素数を掛けた範囲を参照する）
+_LANCZOS_SUPPORT = 3.0
+# 1バイトあたりの画素数の上限の目安。対象の形式で最も圧縮されるのは単色のJPEGで、
+# DC成分に1ブロック（64画素）あたり1ビット以上かかるため最大512画素（Pillowの出力の実測では約256画素）。
+# これより小さいデータは LARGE_IMAGE_PIXELS に届かないため、ヘッダーを読まずに対象外とする
+_MAX_PIXELS_PER_BYTE = 1024
+
+
+def cover_geometry(
+    source_size: tuple[int, int],
+    target_size: tuple[int, int]
+) -> tuple[tuple[int, int], tuple[int, int]]:
+    """
+    「余白なしで覆う」リサイズの寸法を計算します（ImageProcessor._resize_to_target と帯ごとの縮小で共通）。
+
+    Returns:
+        (リサイズ後のサイズ, クロップの左上座標)
+    """
+    target_width, target_height = target_size
+    original_width, original_height = source_size
+    target_aspect = target_width / target_height
+    original_aspect = original_width / original_height
+
+    if abs(original_aspect - target_aspect) < 0.001:
+        return target_size, (0, 0)
+
+    if original_aspect > target_aspect:
+        new_width = target_width
+        new_height = int(original_height * target_width / original_width)
+        if new_height < target_height:
+            new_height = target_height
+            new_width = int(original_width * target_height / original_height)
+    else:
+        new_height = target_height
+        new_width = int(original_width * target_height / original_height)
+        if new_width < target_width:
+            new_width = target_width
+            new_height = int(original_height * target_width / original_width)
+    return (new_width, new_height), ((new_width - target_width) // 2, (new_height - target_height) // 2)
+
+
+def to_rgb(image: Image.Image) -> Image.Image:
+    """RGBに変換（透明部分は白で塗りつぶし。ImageProcessorと帯ごとの縮小で共通）"""
+    if image.mode == "RGB":
+        return image
+    if image.mode == "RGBA":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        return background
+    return image.convert("RGB")
+
+
+def _open(fp: BinaryIO, max_pixels: int) -> Image.Image:
+    """
+    Image.open と同じ手順で画像を開きます（ヘッダーのみ読み込み、デコードはしない）。
+    画素数の上限にはPillowの MAX_IMAGE_PIXELS ではなく max_pixels を使います。
+
+    Raises:
+        Image.DecompressionBombError: 画素数が max_pixels を超える場合
+        Image.UnidentifiedImageError: 画像の形式を判別できない場合
+    """
+    Image.init()
+    fp.seek(0)
+    prefix = fp.read(16)
+    for format_id in Image.ID:
+        factory, accept = Image.OPEN[format_id]
+        # Image.open と同様に、判定（accept）も含めて失敗した形式は次の形式を試す
+        try:
+            result = not accept or accept(prefix)
+            if not result or isinstance(result, str):
+                continue
+            fp.seek(0)
+            image = factory(fp, "")
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+        if max_pixels > 0 and image.width * image.height > max_pixels:
+            raise Image.DecompressionBombError(
+                f"画像の画素数（{image.width * image.height}）が上限（{max_pixels}）を超えています"
+            )
+        return image
+    raise Image.UnidentifiedImageError("画像の形式を判別できませんでした")
+
+
+def _raw_tiles(image: Image.Image) -> Optional[list[tuple]]:
+    """
+    帯ごとに読み込める非圧縮のタイル一覧を返します。
+    対象外の画像（圧縮・重なりのあるタイルなど）の場合はNoneを返します。
+
+    Returns:
+        (x0, y0, x1, y1, offset, rawmode, stride, ystep) のリスト
+    """
+    tiles = []
+    area = 0
+    for tile in image.tile:
+        decoder_name, extents, offset, args = tile[0], tile[1], tile[2], tile[3]
+        if decoder_name != "raw" or extents is None:
+            return None
+        if isinstance(args, str):
+            args = (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        ystep = args[2] if len(args) > 2 else 1
+        x0, y0, x1, y1 = extents
+        if ystep not in (1, -1):
+            return None
+        if not stride:
+            # 行の境界にパディングがない場合は1行分のバイト数を計算
+            try:
+                stride = len(Image.new(image.mode, (x1 - x0, 1)).tobytes("raw", rawmode))
+            except (ValueError, OSError):
+                return None
+        tiles.append((x0, y0, x1, y1, offset, rawmode, stride, ystep))
+        area += (x1 - x0) * (y1 - y0)
+    # チャンネルごとのタイルなど、同じ範囲を複数のタイルで書き込む形式は対象外
+    if not tiles or area != image.width * image.height:
+        return None
+    return tiles
+
+
+def _read_rows(
+    fp: BinaryIO,
+    image: Image.Image,
+    tiles: list[tuple],
+    top: int,
+    bottom: int
+) -> Image.Image:
+    """元画像の行 [top, bottom) だけを読み込む"""
+    band = Image.new(image.mode, (image.width, bottom - top))
+    if image.mode == "P":
+        band.putpalette(image.getpalette())
+    for x0, y0, x1, y1, offset, rawmode, stride, ystep in tiles:
+        start, end = max(y0, top), min(y1, bottom)
+        if start >= end:
+            continue
+        rows = end - start
+        # 下から上に格納されている場合（BMPなど）はファイル内の行の順序が逆になる
+        first_row = start - y0 if ystep == 1 else y1 - end
+        fp.seek(offset + first_row * stride)
+        raw = fp.read(rows * stride)
+        if len(raw) < rows * stride:
+            raise OSError("画像ファイルが途中で切れています")
+        part = Image.frombytes(
+            image.mode,
+            (x1 - x0, rows),
+            raw,
+            "raw",
+            rawmode,
+            stride,
+            ystep
+        )
+        band.paste(part, (x0, start - top))
+    return band
+
+
+class StripResizer:
+    """巨大な画像を、全体を展開せずにターゲットサイズへ縮小します。"""
+
+    def __init__(self, min_pixels: int, budget_bytes: int, max_pixels: int = 0):
+        self.min_pixels = min_pixels
+        self.budget_bytes = budget_bytes
+        self.max_pixels = max_pixels
+
+    @classmethod
+    def from_env(cls) -> "StripResizer":
+        return cls(
+            min_pixels=int(os.getenv("LARGE_IMAGE_PIXELS", "40000000")),
+            budget_bytes=int(float(os.getenv("STRIP_RESIZE_BUDGET_MB", "32")) * 1024 * 1024),
+            max_pixels=int(os.getenv("STRIP_RESIZE_MAX_PIXELS", "1000000000"))
+        )
+
+    def open(self, source: Union[bytes, BinaryIO]) -> Image.Image:
+        """STRIP_RESIZE_MAX_PIXELS を上限として画像を開きます（ヘッダーのみ読み込み）。"""
+        fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+        return _open(fp, self.max_pixels)
+
+    def resize(
+        self,
+        source: Union[bytes, BinaryIO],
+        target_size: tuple[int, int]
+    ) -> Optional[tuple[Image.Image, tuple[int, int]]]:
+        """
+        巨大な画像をターゲットサイズ（RGB）に縮小します。
+
+        Args:
+            source: 画像のバイトデータ、またはシーク可能なファイル（帯ごとに必要な範囲だけを読み込む）
+
+        Returns:
+            (縮小した画像, 元画像のサイズ)。対象外の画像の場合はNone
+        """
+        if self.min_pixels <= 0:
+            return None
+        if isinstance(source, (bytes, bytearray)) and len(source) * _MAX_PIXELS_PER_BYTE < self.min_pixels:
+            return None
+        fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+        image = _open(fp, self.max_pixels)
+        source_size = image.size
+        if image.width * image.height < self.min_pixels:
+            return None
+
+        if image.format == "JPEG":
+            return self._resize_jpeg(image, target_size), source_size
+
+        tiles = _raw_tiles(image)
+        if tiles is None:
+            logger.info("途中から読み込めない形式のため、通常の方法でリサイズします: %s %s", image.format, source_size)
+            return None
+        return self._resize_strips(fp, image, tiles, target_size), source_size
+
+    def _resize_jpeg(self, image: Image.Image, target_size: tuple[int, int]) -> Image.Image:
+        """デコード時に縮小（1/2〜1/8）してからリサイズ"""
+        source_size = image.size
+        factor = _reduction_factor(source_size, target_size)
+        if factor > 1:
+            image.draft(image.mode, (image.width // factor, image.height // factor))
+        image = to_rgb(image)
+        (new_width, new_height), (crop_left, crop_top) = cover_geometry(source_size, target_size)
+        # draftで縮小された実際の倍率に合わせてクロップ範囲を元画像の座標から換算
+        scale_x = image.width / new_width
+        scale_y = image.height / new_height
+        box = (
+            crop_left * scale_x,
+            crop_top * scale_y,
+            (crop_left + target_size[0]) * scale_x,
+            (crop_top + target_size[1]) * scale_y
+        )
+        return image.resize(target_size, Image.Resampling.LANCZOS, box=box)
+
+    def _resize_strips(
+        self,
+        fp: BinaryIO,
+        image: Image.Image,
+        tiles: list[tuple],
+        target_size: tuple[int, int]
+    ) -> Image.Image:
+        """
+        出力を横長の帯に分け、帯ごとに必要な元画像の行だけを読み込んでリサンプリングします。
+
+        帯の上下にはLANCZOSのサポート半径分の行を余分に読み込むため、
+        画像全体を一度にリサイズした場合と同じ結果になります。
+        """
+        target_width, target_height = target_size
+        (new_width, new_height), (crop_left, crop_top) = cover_geometry(image.size, target_size)
+        scale_x = image.width / new_width
+        scale_y = image.height / new_height
+        margin = math.ceil(_LANCZOS_SUPPORT * max(scale_y, 1.0)) + 1
+
+        # 元画像の1行あたりのメモリ（読み込み時とRGB変換後の両方を見込む）から帯の高さを決める
+        row_bytes = image.width * 8
+        source_rows = max(self.budget_bytes // row_bytes - 2 * margin, 1)
+        band_height = max(int(source_rows / scale_y), 1)
+
+        output = Image.new("RGB", target_size)
+        for out_top in range(0, target_height, band_height):
+            out_bottom = min(out_top + band_height, target_height)
+            src_top = (crop_top + out_top) * scale_y
+            src_bottom = (crop_top + out_bottom) * scale_y
+            top = max(math.floor(src_top) - margin, 0)
+            bottom = min(math.ceil(src_bottom) + margin, image.height)
+
+            band = to_rgb(_read_rows(fp, image, tiles, top, bottom))
+            box = (
+                crop_left * scale_x,
+                src_top - top,
+                (crop_left + target_width) * scale_x,
+                src_bottom - top
+            )
+            output.paste(
+                band.resize((target_width, out_bottom - out_top), Image.Resampling.LANCZOS, box=box),
+                (0, out_top)
+            )
+        return output
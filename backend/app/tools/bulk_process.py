@@ -0,0 +1,377 @@
+"""
+大量画像のオフライン一括処理CLI
+
+HTTP APIを経由せずに、ImageProcessorの処理をプロセスプールで並列実行します。
+
+使い方（backendディレクトリで実行）:
+    python -m app.tools.bulk_process ./archive -o ./output --mode vertical
+    python -m app.tools.bulk_process --file-list files.txt -o ./output --workers 8
+    python -m app.tools.bulk_process ./archive/2019 ./archive/2020 -o ./output --base-dir ./archive
+
+- 出力先は入力のディレクトリ構造を保ちます。基準は --base-dir、省略時はすべての入力の共通の親ディレクトリです
+  （archive/2019/IMG_0001.jpg と archive/2020/IMG_0001.jpg は 2019/IMG_0001.jpg と 2020/IMG_0001.jpg に出力）
+- 出力は一時ファイルに書き込んでからリネームするため、中断しても壊れたファイルは残りません
+- 完了した入力は（ハッシュ, 出力先）単位でマニフェストに記録され、再実行時にはスキップされます
+- JPEG以外の入力は元の拡張子を残して出力します（a.png → a.png.jpg。a.jpg の出力と区別するため）
+- 複数の入力が同じ出力先になる場合は、2件目以降を失敗として扱います（上書きしない）
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 処理対象とする拡張子
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+# 出力と同じ拡張子（出力先のファイル名をそのまま使う）
+JPEG_EXTENSIONS = {".jpg", ".jpeg"}
+MANIFEST_FILENAME = ".manifest.jsonl"
+
+# ワーカープロセスごとのImageProcessor（initializerで生成）
+_worker_processor = None
+
+
+def _init_worker(log_level: int):
+    """ワーカープロセスの初期化"""
+    global _worker_processor
+    logging.basicConfig(
+        level=log_level,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    from app.services.image_processor import ImageProcessor
+    _worker_processor = ImageProcessor()
+
+
+def _resolve_mode(size: tuple[int, int], mode: str) -> str:
+    """mode="auto"の場合は元画像の向きからモードを決定"""
+    if mode != "auto":
+        return mode
+    width, height = size
+    return "horizontal" if width > height else "vertical"
+
+
+def _write_atomic(path: Path, data: bytes):
+    """一時ファイルに書き込んでからリネームする（中断時に壊れたファイルを残さない）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _process_one(
+    source: str,
+    output: str,
+    mode: str,
+    upscale_method: str,
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None
+) -> dict:
+    """ワーカープロセスで1枚処理し、統計情報を返す"""
+    started = time.perf_counter()
+    try:
+        # ファイルのまま渡す（巨大な非圧縮画像は全体を読み込まずに帯ごとに処理される）
+        with open(source, "rb") as f:
+            input_bytes = os.fstat(f.fileno()).st_size
+            # ヘッダーのみ読み込む（デコードはしない）
+            width, height = _worker_processor.strip_resizer.open(f).size
+            resolved_mode = _resolve_mode((width, height), mode)
+            processed = _worker_processor._process_image_sync(
+                f, resolved_mode, upscale_method, max_bytes, min_psnr
+            )
+        _write_atomic(Path(output), processed.data)
+        return {
+            "ok": True,
+            "pixels": width * height,
+            "input_bytes": input_bytes,
+            "output_bytes": len(processed.data),
+            "quality": processed.quality,
+            "seconds": time.perf_counter() - started,
+        }
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def file_sha256(path: Path) -> str:
+    """ファイルのSHA-256をストリーミングで計算"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def output_path(relative: Path) -> Path:
+    """出力先の相対パス（JPEG以外は元の拡張子を残す: a.png → a.png.jpg）"""
+    if relative.suffix.lower() in JPEG_EXTENSIONS:
+        return relative
+    return relative.with_name(relative.name + ".jpg")
+
+
+def work_key(
+    digest: str,
+    mode: str,
+    upscale_method: str,
+    output: str,
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None
+) -> str:
+    """
+    マニフェストのキー（入力ハッシュ + 処理設定 + 出力先）
+
+    同じ内容のファイルが別のパスにある場合も、それぞれの出力先に出力するため出力先を含めます。
+    """
+    key = f"{digest}:{mode}:{upscale_method}"
+    if max_bytes is not None or min_psnr is not None:
+        key += f":auto(max_bytes={max_bytes},min_psnr={min_psnr})"
+    return f"{key}:{output}"
+
+
+def load_manifest(path: Path) -> set[str]:
+    """マニフェストから完了済みキーを読み込む（途中で切れた行は無視）"""
+    completed = set()
+    if not path.exists():
+        return completed
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["key"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return completed
+
+
+def _absolute(path: Path) -> Path:
+    """絶対パス（シンボリックリンクは解決しない。ディレクトリ内のリンク先が外にあっても構造を保つため）"""
+    return Path(os.path.abspath(path))
+
+
+def _iter_file_list(file_list: str) -> Iterator[str]:
+    with open(file_list, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def common_base(inputs: list[str], file_list: Optional[str]) -> Path:
+    """
+    出力先の相対パスの基準（すべての入力の共通の親ディレクトリ）
+
+    ディレクトリの入力はそのディレクトリ、ファイルの入力はその親ディレクトリを対象にします
+    （ディレクトリを1つだけ指定した場合は、そのディレクトリからの相対パスになります）。
+
+    Raises:
+        ValueError: 共通の親ディレクトリがない場合（Windowsで別のドライブにある場合など）
+    """
+    directories = set()
+    for entry in inputs:
+        path = _absolute(Path(entry))
+        directories.add(path if path.is_dir() else path.parent)
+    if file_list:
+        # ファイルリストは大きい場合があるため、親ディレクトリのみ保持する
+        for line in _iter_file_list(file_list):
+            directories.add(_absolute(Path(line)).parent)
+    if not directories:
+        raise ValueError("入力がありません")
+    return Path(os.path.commonpath([str(d) for d in directories]))
+
+
+def iter_sources(
+    inputs: list[str],
+    file_list: Optional[str],
+    base_dir: Path
+) -> Iterator[tuple[Path, Optional[Path]]]:
+    """
+    (入力ファイル, 出力先の相対パス) を列挙
+
+    出力先は base_dir からの相対パスです。base_dir の外にある入力の相対パスは None になります。
+    """
+    base_dir = _absolute(base_dir)
+
+    def relative(path: Path) -> Optional[Path]:
+        try:
+            return _absolute(path).relative_to(base_dir)
+        except ValueError:
+            return None
+
+    for entry in inputs:
+        root = Path(entry)
+        if root.is_dir():
+            for path in sorted(root.rglob("*")):
+                if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+                    yield path, relative(path)
+        elif root.is_file():
+            yield root, relative(root)
+        else:
+            logger.warning("入力が見つかりません: %s", entry)
+
+    if file_list:
+        for line in _iter_file_list(file_list):
+            path = Path(line)
+            if path.is_file():
+                yield path, relative(path)
+            else:
+                logger.warning("入力が見つかりません: %s", line)
+
+
+def run(args: argparse.Namespace) -> int:
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(args.manifest) if args.manifest else output_dir / MANIFEST_FILENAME
+    completed = load_manifest(manifest_path)
+
+    if args.base_dir:
+        base_dir = Path(args.base_dir)
+    else:
+        try:
+            base_dir = common_base(args.inputs, args.file_list)
+        except ValueError as e:
+            logger.error("出力先の基準ディレクトリを決められません（--base-dir を指定してください）: %s", e)
+            return 2
+    logger.info("出力先の基準ディレクトリ: %s", base_dir)
+
+    workers = args.workers or os.cpu_count() or 1
+    # 同時に投入するジョブ数の上限（ワーカー側のメモリ使用量を制限）
+    max_in_flight = args.max_in_flight or workers * 2
+    worker_log_level = logging.INFO if args.verbose else logging.WARNING
+
+    stats = {"done": 0, "skipped": 0, "failed": 0, "pixels": 0, "input_bytes": 0, "output_bytes": 0}
+    # この実行で割り当てた出力先 → 入力（同じ出力先への上書きを防ぐ）
+    claimed: dict[Path, Path] = {}
+    started = time.perf_counter()
+
+    with open(manifest_path, "a", encoding="utf-8") as manifest, ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(worker_log_level,),
+    ) as pool:
+        in_flight = {}
+
+        def drain(return_when):
+            done, _ = wait(in_flight, return_when=return_when)
+            for future in done:
+                key, source, output = in_flight.pop(future)
+                result = future.result()
+                if not result["ok"]:
+                    stats["failed"] += 1
+                    logger.error("処理失敗: %s (%s)", source, result["error"])
+                    continue
+                stats["done"] += 1
+                stats["pixels"] += result["pixels"]
+                stats["input_bytes"] += result["input_bytes"]
+                stats["output_bytes"] += result["output_bytes"]
+                completed.add(key)
+                manifest.write(json.dumps({
+                    "key": key,
+                    "source": str(source),
+                    "output": str(output),
+                    "quality": result["quality"],
+                    "output_bytes": result["output_bytes"],
+                    "seconds": round(result["seconds"], 4),
+                }, ensure_ascii=False) + "\n")
+                manifest.flush()
+                total = stats["done"] + stats["failed"]
+                if total % args.progress_every == 0:
+                    logger.info("進捗: 完了=%d, 失敗=%d, スキップ=%d", stats["done"], stats["failed"], stats["skipped"])
+
+        for source, relative in iter_sources(args.inputs, args.file_list, base_dir):
+            if relative is None:
+                stats["failed"] += 1
+                logger.error("入力が基準ディレクトリ %s の外にあります: %s", base_dir, source)
+                continue
+            relative_output = output_path(relative)
+            previous = claimed.setdefault(relative_output, source.resolve())
+            if previous != source.resolve():
+                stats["failed"] += 1
+                logger.error("出力先が重複しています: %s (%s と同じ %s)", source, previous, relative_output)
+                continue
+            key = work_key(
+                file_sha256(source), args.mode, args.upscale_method, relative_output.as_posix(),
+                args.max_bytes, args.min_psnr
+            )
+            if key in completed:
+                stats["skipped"] += 1
+                continue
+            completed.add(key)
+            output = output_dir / relative_output
+            future = pool.submit(
+                _process_one, str(source), str(output), args.mode, args.upscale_method, args.max_bytes, args.min_psnr
+            )
+            in_flight[future] = (key, source, output)
+            if len(in_flight) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+
+        if in_flight:
+            drain(ALL_COMPLETED)
+
+    elapsed = time.perf_counter() - started
+    megapixels = stats["pixels"] / 1_000_000
+    print(
+        f"完了: {stats['done']}枚, 失敗: {stats['failed']}枚, スキップ: {stats['skipped']}枚, "
+        f"経過時間: {elapsed:.1f}秒"
+    )
+    if elapsed > 0:
+        print(
+            f"スループット: {stats['done'] / elapsed:.2f} images/s, {megapixels / elapsed:.2f} MP/s "
+            f"(入力 {stats['input_bytes'] / 1_000_000:.1f}MB → 出力 {stats['output_bytes'] / 1_000_000:.1f}MB)"
+        )
+    return 1 if stats["failed"] else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="画像を規定サイズに一括リサイズします")
+    parser.add_argument("inputs", nargs="*", help="入力ディレクトリまたはファイル")
+    parser.add_argument("--file-list", help="入力ファイルのパスを1行ずつ記載したファイル")
+    parser.add_argument("-o", "--output-dir", required=True, help="出力ディレクトリ")
+    parser.add_argument(
+        "--base-dir",
+        help="出力先の相対パスの基準ディレクトリ（デフォルト: すべての入力の共通の親ディレクトリ）"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["vertical", "horizontal", "auto"],
+        default="vertical",
+        help="vertical (1080x1350), horizontal (1350x1080), auto (元画像の向きで決定)",
+    )
+    parser.add_argument("--upscale-method", choices=["simple", "enhance", "ai"], default="simple")
+    parser.add_argument("--max-bytes", type=int, help="出力サイズの上限（バイト）。指定するとJPEGの品質を自動で選択")
+    parser.add_argument("--min-psnr", type=float, help="画質の下限（PSNR, dB）。指定すると条件を満たす最小の品質を選択")
+    parser.add_argument("--workers", type=int, default=0, help="ワーカープロセス数（デフォルト: CPU数）")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="同時投入ジョブ数の上限（デフォルト: ワーカー数×2）")
+    parser.add_argument("--manifest", help=f"マニフェストのパス（デフォルト: 出力ディレクトリ/{MANIFEST_FILENAME}）")
+    parser.add_argument("--progress-every", type=int, default=100, help="進捗を表示する間隔（枚数）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="ワーカーの詳細ログを表示")
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.file_list:
+        parser.error("入力ディレクトリ/ファイルまたは --file-list を指定してください")
+    if args.progress_every < 1:
+        parser.error("--progress-every は1以上を指定してください")
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+"""
+リサイズ処理の差分等価性チェック
+
+リサイズ・クロップ・エンコードの処理は ImageProcessor（コーデック・縮小デコード・帯ごとの縮小を含む）と
+Vercel関数（api/process.py, api/process-multiple.py）に別々に実装されています。
+合成画像のコーパス（サイズ・アスペクト比・フォーマット・カラーモード）をすべての処理経路で処理し、
+Pillowで全体をデコードしてLANCZOSでリサイズ・クロップした参照画像と比べて、
+出力サイズが規定サイズと完全に一致すること、PSNR・SSIMが下限以上であることを確認します。
+
+JPEGの圧縮による劣化は画像の内容によって大きく異なる（減色した画像では品質95でも35dB程度）ため、
+下限は「参照画像を同じ品質でPillowで圧縮した場合の値」から経路ごとの許容幅を引いた値とします。
+クロップ位置が1画素ずれると、PSNRはおおむね2dB以上下がります。
+参照画像のリサイズ後のサイズ・クロップ位置は、検査対象（strip_resize.cover_geometry など）を使わずに計算します。
+高画質化の経路は、参照画像を同じ方法で高画質化した画像と比較します（参照画像との差は意図したものであるため）。
+
+高速化（デコード方法・リサイズ方法・コーデックの変更）で出力が変わっていないかの確認に使用します。
+1件でも条件を満たさない場合は終了コード1を返します。
+
+使い方（backendディレクトリで実行）:
+    python -m app.tools.equivalence
+    python -m app.tools.equivalence --quick --pipeline backend:strip --pipeline api/process.py -v
+"""
+import argparse
+import copy
+import importlib.util
+import io
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+from PIL import Image
+
+from app.services.codecs import FORMATS, CodecSelector, OpenCVCodec, PillowCodec
+from app.services.image_processor import ImageProcessor
+from app.services.jpeg_quality import MIN_QUALITY
+from app.services.strip_resize import StripResizer
+
+# リポジトリのルート（Vercel関数の api/ ディレクトリがある場所）
+REPO_ROOT = Path(__file__).resolve().parents[3]
+
+TARGET_SIZES = {"vertical": ImageProcessor.VERTICAL_SIZE, "horizontal": ImageProcessor.HORIZONTAL_SIZE}
+
+# (幅, 高さ): 横長・縦長・規定サイズと同じ比率・ほぼ同じ比率・極端な比率・規定サイズより小さい画像
+SIZES = [
+    (1600, 1200),
+    (1200, 1600),
+    (1440, 1800),
+    (1351, 1080),
+    (2400, 480),
+    (500, 1500),
+    (640, 480),
+    (300, 300),
+]
+# --quick で使うサイズ（横長の縮小・縦長の縮小・拡大）
+QUICK_SIZES = [(1600, 1200), (1200, 1600), (640, 480)]
+# (フォーマット, カラーモード)
+VARIANTS = [
+    ("JPEG", "RGB"),
+    ("JPEG", "L"),
+    ("PNG", "RGBA"),
+    ("PNG", "P"),
+    ("TIFF", "RGB"),
+    ("BMP", "RGB"),
+    ("WEBP", "RGB"),
+]
+# 縮小デコード（1/2以下）・帯ごとの縮小の対象になる大きな画像（対象のフォーマットのみ）
+LARGE_SIZE = (2880, 3600)
+LARGE_VARIANTS = [("JPEG", "RGB"), ("JPEG", "L"), ("TIFF", "RGB")]
+
+# 出力サイズの上限を指定する経路で使う値
+MAX_BYTES = 200_000
+
+# 許容するPSNR（dB）・SSIMの低下幅（参照画像を同じ品質で圧縮した場合との差）
+# 全体をデコードしてLANCZOSでリサイズする経路: コーデック・実装の違いによる誤差のみ
+EXACT = (0.3, 0.001)
+# 縮小デコード・帯ごとの縮小: 縮小の段階が増える分の誤差（1/2以下に縮小する画像で最大1.5dB程度）
+REDUCED = (2.0, 0.002)
+
+
+@dataclass
+class Case:
+    """コーパスの1画像"""
+    name: str
+    data: bytes
+    size: tuple[int, int]
+
+
+@dataclass
+class Pipeline:
+    """
+    処理経路
+
+    run(画像データ, モード) は (出力のJPEG, 使用した品質) を返します。
+    psnr_tolerance / ssim_tolerance は、参照画像を同じ品質で圧縮した場合の値からの許容される低下幅です。
+    golden を指定した場合は、golden(参照画像, 元画像のサイズ) を参照画像の代わりに使います。
+    """
+    name: str
+    run: Callable[[bytes, str], tuple[bytes, int]]
+    psnr_tolerance: float
+    ssim_tolerance: float
+    max_bytes: Optional[int] = None
+    golden: Optional[Callable[[np.ndarray, tuple[int, int]], np.ndarray]] = None
+
+
+def synthetic_rgb(size: tuple[int, int], seed: int) -> np.ndarray:
+    """合成画像（グラデーション + 円 + 細かい縞 + 弱いノイズ）"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    u, v = x / width, y / height
+    image = np.stack([255 * u, 255 * v, 255 * (1 - u) * v + 64], axis=-1)
+    # 円（くっきりしたエッジ）
+    for _ in range(6):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        radius = rng.uniform(0.05, 0.25) * min(width, height)
+        inside = (x - cx) ** 2 + (y - cy) ** 2 < radius ** 2
+        image[inside] = rng.uniform(0, 255, size=3)
+    # 細かい縞（クロップ位置がずれると参照画像との差が大きくなる）
+    image += 24 * np.sin(x / 3.0 + y / 7.0)[..., None]
+    image += rng.normal(0, 3, size=image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def _encode_case(rgb: Image.Image, format: str, mode: str) -> bytes:
+    if mode == "RGBA":
+        # 左から右へ不透明になるアルファ（透明部分は白で塗りつぶされる）
+        alpha = np.linspace(0, 255, rgb.width, dtype=np.uint8)
+        image = rgb.copy()
+        image.putalpha(Image.fromarray(np.ascontiguousarray(np.broadcast_to(alpha, (rgb.height, rgb.width)))))
+    elif mode == "P":
+        image = rgb.quantize(256)
+    else:
+        image = rgb.convert(mode)
+    output = io.BytesIO()
+    options = {"quality": 95} if format in ("JPEG", "WEBP") else {}
+    image.save(output, format=format, **options)
+    return output.getvalue()
+
+
+def build_corpus(quick: bool = False) -> list[Case]:
+    groups = [(size, VARIANTS) for size in (QUICK_SIZES if quick else SIZES)]
+    groups.append((LARGE_SIZE, LARGE_VARIANTS))
+    cases = []
+    for seed, (size, variants) in enumerate(groups):
+        rgb = Image.fromarray(synthetic_rgb(size, seed))
+        for format, mode in variants:
+            cases.append(Case(f"{size[0]}x{size[1]}-{format}-{mode}", _encode_case(rgb, format, mode), size))
+    return cases
+
+
+def reference_geometry(
+    source_size: tuple[int, int],
+    target_size: tuple[int, int]
+) -> tuple[tuple[int, int], tuple[int, int]]:
+    """
+    参照画像のリサイズ後のサイズとクロップの左上座標（仕様どおりの最小限の実装）
+
+    アスペクト比がほぼ同じ（差が0.001未満）なら規定サイズへ直接リサイズし、
+    それ以外は規定サイズを覆う最小の倍率（短辺側を合わせ、長辺側は切り捨て）でリサイズして中央をクロップします。
+    検査対象の cover_geometry・_resize_to_target の不具合が参照画像に伝わらないよう、独立に計算します。
+    """
+    (width, height), (target_width, target_height) = source_size, target_size
+    if abs(width / height - target_width / target_height) < 0.001:
+        return target_size, (0, 0)
+    if width / height > target_width / target_height:
+        size = (int(width * target_height / height), target_height)
+    else:
+        size = (target_width, int(height * target_width / width))
+    return size, ((size[0] - target_width) // 2, (size[1] - target_height) // 2)
+
+
+def reference(data: bytes, target_size: tuple[int, int]) -> np.ndarray:
+    """参照画像（Pillowで全体をデコード → RGB → LANCZOSでリサイズ → 中央をクロップ）"""
+    image = Image.open(io.BytesIO(data))
+    if image.mode == "RGBA":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        image = background
+    else:
+        image = image.convert("RGB")
+    (new_width, new_height), (left, top) = reference_geometry(image.size, target_size)
+    resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    return np.asarray(resized.crop((left, top, left + target_size[0], top + target_size[1])))
+
+
+def psnr(reference_rgb: np.ndarray, output_rgb: np.ndarray) -> float:
+    mse = np.mean((reference_rgb.astype(np.float64) - output_rgb.astype(np.float64)) ** 2)
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def ssim(reference_rgb: np.ndarray, output_rgb: np.ndarray, block: int = 8) -> float:
+    """輝度のSSIM（8×8のブロックごとに計算した平均）"""
+    def blocks(rgb: np.ndarray) -> np.ndarray:
+        luma = rgb.astype(np.float64) @ np.array([0.299, 0.587, 0.114])
+        height, width = (luma.shape[0] // block) * block, (luma.shape[1] // block) * block
+        return luma[:height, :width].reshape(height // block, block, width // block, block).swapaxes(1, 2)
+
+    a, b = blocks(reference_rgb), blocks(output_rgb)
+    mean_a, mean_b = a.mean(axis=(2, 3)), b.mean(axis=(2, 3))
+    var_a, var_b = a.var(axis=(2, 3)), b.var(axis=(2, 3))
+    covariance = ((a - mean_a[..., None, None]) * (b - mean_b[..., None, None])).mean(axis=(2, 3))
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    index = ((2 * mean_a * mean_b + c1) * (2 * covariance + c2)) / (
+        (mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2)
+    )
+    return float(index.mean())
+
+
+class Baseline:
+    """参照画像を各品質でPillowで圧縮した場合のPSNR・SSIM（品質ごとにキャッシュ）"""
+
+    def __init__(self, expected: np.ndarray):
+        self.expected = expected
+        self._cache: dict[int, tuple[float, float]] = {}
+
+    def at(self, quality: int) -> tuple[float, float]:
+        if quality not in self._cache:
+            output = io.BytesIO()
+            Image.fromarray(self.expected).save(output, format="JPEG", quality=quality)
+            decoded = np.asarray(Image.open(output).convert("RGB"))
+            self._cache[quality] = (psnr(self.expected, decoded), ssim(self.expected, decoded))
+        return self._cache[quality]
+
+
+def _codecs(codec_class, reduced_decode: bool) -> CodecSelector:
+    """すべてのフォーマットを指定のコーデックで処理する CodecSelector"""
+    codec = codec_class(reduced_decode=reduced_decode)
+    return CodecSelector(
+        {format: codec for format in FORMATS},
+        {format: codec for format in FORMATS},
+        PillowCodec(reduced_decode=reduced_decode)
+    )
+
+
+def _backend(
+    base: ImageProcessor,
+    codecs: CodecSelector,
+    strip_resizer: StripResizer,
+    upscale_method: str = "simple",
+    max_bytes: Optional[int] = None,
+    min_psnr: Optional[float] = None
+) -> Callable[[bytes, str], tuple[bytes, int]]:
+    processor = copy.copy(base)
+    processor.codecs = codecs
+    processor.strip_resizer = strip_resizer
+
+    def run(data: bytes, mode: str) -> tuple[bytes, int]:
+        processed = processor._process_image_sync(data, mode, upscale_method, max_bytes, min_psnr)
+        return processed.data, processed.quality
+    return run
+
+
+def _serverless(filename: str, max_bytes: Optional[int] = None) -> Callable[[bytes, str], tuple[bytes, int]]:
+    """Vercel関数のファイルを読み込み、その process_image_sync を使う"""
+    path = REPO_ROOT / "api" / filename
+    spec = importlib.util.spec_from_file_location(f"serverless_{path.stem.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    def run(data: bytes, mode: str) -> tuple[bytes, int]:
+        return module.process_image_sync(data, mode, max_bytes)
+    return run
+
+
+def enhanced(processor: ImageProcessor) -> Callable[[np.ndarray, tuple[int, int]], np.ndarray]:
+    """高画質化の経路の参照画像（参照画像を ImageProcessor と同じ方法で高画質化）"""
+    def golden(expected: np.ndarray, source_size: tuple[int, int]) -> np.ndarray:
+        return np.asarray(processor._upscale_enhance(Image.fromarray(expected), source_size))
+    return golden
+
+
+def build_pipelines() -> list[Pipeline]:
+    no_strip = StripResizer(min_pixels=0, budget_bytes=0)
+    # すべての非圧縮画像を帯ごとに縮小し、1つの帯を小さくして帯の境界を多く含める
+    strip = StripResizer(min_pixels=1, budget_bytes=256 * 1024)
+    pillow = _codecs(PillowCodec, reduced_decode=False)
+    base = ImageProcessor()
+    pipelines = [
+        Pipeline("backend:pillow", _backend(base, pillow, no_strip), *EXACT),
+        Pipeline("backend:pillow+reduced", _backend(base, _codecs(PillowCodec, True), no_strip), *REDUCED),
+        Pipeline("backend:strip", _backend(base, pillow, strip), *REDUCED),
+        Pipeline("backend:enhance", _backend(base, pillow, no_strip, "enhance"), *EXACT, golden=enhanced(base)),
+        Pipeline("backend:max_bytes", _backend(base, pillow, no_strip, max_bytes=MAX_BYTES), *EXACT, MAX_BYTES),
+        Pipeline("backend:min_psnr", _backend(base, pillow, no_strip, min_psnr=36.0), *EXACT),
+        Pipeline("api/process.py", _serverless("process.py"), *EXACT),
+        Pipeline("api/process.py:max_bytes", _serverless("process.py", MAX_BYTES), *EXACT, MAX_BYTES),
+        Pipeline("api/process-multiple.py", _serverless("process-multiple.py"), *EXACT),
+    ]
+    try:
+        pipelines[1:1] = [
+            Pipeline("backend:opencv", _backend(base, _codecs(OpenCVCodec, False), no_strip), *EXACT),
+            Pipeline("backend:opencv+reduced", _backend(base, _codecs(OpenCVCodec, True), no_strip), *REDUCED),
+        ]
+    except ImportError:
+        print("OpenCVがインストールされていないため、OpenCVの経路はスキップします", file=sys.stderr)
+    return pipelines
+
+
+def check(pipeline: Pipeline, case: Case, mode: str, baseline: Baseline) -> tuple[Optional[str], dict]:
+    """1件を処理して参照画像と比較し、(失敗の理由, 計測値) を返します。"""
+    target_size = TARGET_SIZES[mode]
+    try:
+        data, quality = pipeline.run(case.data, mode)
+        output = Image.open(io.BytesIO(data))
+        output_size = output.size
+        output_rgb = np.asarray(output.convert("RGB"))
+    except Exception as e:
+        return f"処理に失敗しました: {type(e).__name__}: {e}", {}
+
+    if output_size != target_size:
+        return f"出力サイズが異なります: {output_size} != {target_size}", {}
+    baseline_psnr, baseline_ssim = baseline.at(quality)
+    measured = {
+        "psnr": psnr(baseline.expected, output_rgb),
+        "ssim": ssim(baseline.expected, output_rgb),
+        "bytes": len(data),
+        "quality": quality,
+    }
+    # 参照画像を同じ品質で圧縮した場合からの低下幅
+    measured["psnr_drop"] = max(baseline_psnr - measured["psnr"], 0.0)
+    measured["ssim_drop"] = max(baseline_ssim - measured["ssim"], 0.0)
+    if measured["psnr_drop"] > pipeline.psnr_tolerance:
+        return (
+            f"PSNRが下限未満です: {measured['psnr']:.2f} < {baseline_psnr - pipeline.psnr_tolerance:.2f} "
+            f"(参照 {baseline_psnr:.2f} - 許容 {pipeline.psnr_tolerance})"
+        ), measured
+    if measured["ssim_drop"] > pipeline.ssim_tolerance:
+        return (
+            f"SSIMが下限未満です: {measured['ssim']:.4f} < {baseline_ssim - pipeline.ssim_tolerance:.4f} "
+            f"(参照 {baseline_ssim:.4f} - 許容 {pipeline.ssim_tolerance})"
+        ), measured
+    if pipeline.max_bytes is not None and len(data) > pipeline.max_bytes and quality > MIN_QUALITY:
+        return f"出力サイズの上限を超えています: {len(data)} > {pipeline.max_bytes} (quality={quality})", measured
+    return None, measured
+
+
+def run(args: argparse.Namespace) -> int:
+    corpus = build_corpus(args.quick)
+    pipelines = build_pipelines()
+    if args.pipeline:
+        unknown = set(args.pipeline) - {p.name for p in pipelines}
+        if unknown:
+            print(f"不明な経路: {', '.join(sorted(unknown))}", file=sys.stderr)
+            return 2
+        pipelines = [p for p in pipelines if p.name in args.pipeline]
+
+    # 参照画像は経路によらないため先に計算しておく
+    references = {
+        (case.name, mode): reference(case.data, TARGET_SIZES[mode])
+        for case in corpus for mode in args.mode
+    }
+    plain_baselines = {key: Baseline(expected) for key, expected in references.items()}
+
+    failures = []
+    print(f"{'経路':<28}{'件数':>6}{'失敗':>6}{'PSNR低下':>10}{'SSIM低下':>10}{'秒':>8}")
+    # ImageProcessor・Pillowの処理はGILを解放するため、画像ごとにスレッドで並列に処理する
+    with ThreadPoolExecutor(max_workers=args.jobs or os.cpu_count() or 1) as pool:
+        for pipeline in pipelines:
+            started = time.perf_counter()
+            tasks = [(case, mode) for case in corpus for mode in args.mode]
+            baselines = plain_baselines
+            if pipeline.golden is not None:
+                baselines = {
+                    (case.name, mode): Baseline(pipeline.golden(references[(case.name, mode)], case.size))
+                    for case, mode in tasks
+                }
+            results = pool.map(lambda task: check(pipeline, *task, baselines[(task[0].name, task[1])]), tasks)
+            worst_psnr, worst_ssim, failed = 0.0, 0.0, 0
+            for (case, mode), (error, measured) in zip(tasks, results):
+                if measured:
+                    worst_psnr = max(worst_psnr, measured["psnr_drop"])
+                    worst_ssim = max(worst_ssim, measured["ssim_drop"])
+                    if args.verbose:
+                        print(
+                            f"  {pipeline.name} {case.name} {mode}: "
+                            f"psnr={measured['psnr']:.2f} (-{measured['psnr_drop']:.2f}) "
+                            f"ssim={measured['ssim']:.4f} (-{measured['ssim_drop']:.4f}) "
+                            f"quality={measured['quality']} bytes={measured['bytes']}"
+                        )
+                if error:
+                    failed += 1
+                    failures.append(f"{pipeline.name} {case.name} {mode}: {error}")
+            elapsed = time.perf_counter() - started
+            print(
+                f"{pipeline.name:<28}{len(tasks):>6}{failed:>6}"
+                f"{worst_psnr:>10.2f}{worst_ssim:>10.4f}{elapsed:>8.1f}"
+            )
+
+    if failures:
+        print(f"\n{len(failures)}件が条件を満たしませんでした:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\nすべての経路が条件を満たしました")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="すべての処理経路の出力を参照（LANCZOS）と比較します")
+    parser.add_argument("--quick", action="store_true", help="コーパスを小さくする（通常のサイズは3種類）")
+    parser.add_argument(
+        "--mode", action="append", choices=list(TARGET_SIZES),
+        help="確認するモード（複数指定可、デフォルト: 両方）"
+    )
+    parser.add_argument("--pipeline", action="append", help="確認する経路（複数指定可、デフォルト: すべて）")
+    parser.add_argument("--jobs", type=int, default=0, help="並列に処理する画像数（デフォルト: CPU数）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="画像ごとの計測値を表示")
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    args.mode = args.mode or list(TARGET_SIZES)
+    logging.basicConfig(level=logging.WARNING)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
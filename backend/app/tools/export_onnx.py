@@ -0,0 +1,117 @@
+"""
+AIアップスケーラー用ONNXモデルの作成
+
+使い方（backendディレクトリで実行）:
+    # Real-ESRGAN (RealESRGAN_x4plus) の重みをONNXにエクスポートし、int8量子化版も作成
+    python -m app.tools.export_onnx --weights RealESRGAN_x4plus.pth -o models/realesrgan_x4.onnx --quantize
+
+    # 動作確認・ベンチマーク用の小さなモデル（4倍の線形補間）を作成
+    python -m app.tools.export_onnx --tiny -o models/tiny_x4.onnx
+
+エクスポートにはtorchとbasicsr、量子化と小さなモデルの作成にはonnxとonnxruntimeが必要です。
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+OPSET = 17
+
+
+def build_tiny_model(output: Path, scale: int = 4):
+    """4倍の線形補間のみを行う小さなモデルを作成"""
+    import onnx
+    from onnx import TensorProto, helper
+
+    scales = helper.make_tensor("scales", TensorProto.FLOAT, [4], [1.0, 1.0, float(scale), float(scale)])
+    node = helper.make_node("Resize", ["input", "", "scales"], ["output"], mode="linear")
+    graph = helper.make_graph(
+        [node],
+        "tiny_upscaler",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, "height", "width"])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 3, "out_height", "out_width"])],
+        initializer=[scales],
+    )
+    # 古いONNX Runtimeでも読み込めるようにIRバージョンを固定
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", OPSET)], ir_version=8)
+    onnx.checker.check_model(model)
+    onnx.save(model, str(output))
+
+
+def export_realesrgan(weights: Path, output: Path):
+    """RealESRGAN_x4plusの重みをONNXにエクスポート"""
+    import torch
+    from basicsr.archs.rrdbnet_arch import RRDBNet
+
+    model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
+    state = torch.load(str(weights), map_location="cpu")
+    model.load_state_dict(state.get("params_ema", state.get("params", state)), strict=True)
+    model.eval()
+
+    dummy = torch.rand(1, 3, 64, 64)
+    torch.onnx.export(
+        model,
+        dummy,
+        str(output),
+        input_names=["input"],
+        output_names=["output"],
+        dynamic_axes={"input": {2: "height", 3: "width"}, "output": {2: "out_height", 3: "out_width"}},
+        opset_version=OPSET,
+    )
+
+
+def quantize(model_path: Path, output: Path, samples: int = 8, patch: int = 64):
+    """合成画像で較正してint8（QDQ形式）に静的量子化"""
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class SyntheticReader(CalibrationDataReader):
+        def __init__(self):
+            rng = np.random.default_rng(0)
+            x = np.linspace(0, 1, patch, dtype=np.float32)
+            base = np.stack([x[None, :] + x[:, None] * 0, x[:, None] + x[None, :] * 0, (x[None, :] + x[:, None]) / 2])
+            self._data = iter([
+                {"input": np.clip(base + rng.normal(0, 0.1, base.shape), 0, 1).astype(np.float32)[None]}
+                for _ in range(samples)
+            ])
+
+        def get_next(self):
+            return next(self._data, None)
+
+    quantize_static(
+        str(model_path),
+        str(output),
+        SyntheticReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="AIアップスケーラー用のONNXモデルを作成します")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--weights", help="RealESRGAN_x4plus.pth のパス")
+    source.add_argument("--tiny", action="store_true", help="動作確認用の小さなモデルを作成")
+    parser.add_argument("-o", "--output", required=True, help="出力するONNXファイル")
+    parser.add_argument("--quantize", action="store_true", help="int8量子化版（*.int8.onnx）も作成")
+    args = parser.parse_args(argv)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if args.tiny:
+        build_tiny_model(output)
+    else:
+        export_realesrgan(Path(args.weights), output)
+    print(f"作成しました: {output}")
+
+    if args.quantize:
+        quantized = output.with_suffix(".int8.onnx")
+        quantize(output, quantized)
+        print(f"作成しました: {quantized}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
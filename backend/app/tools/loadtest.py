@@ -0,0 +1,270 @@
+"""
+ローカル負荷試験ハーネス
+
+ローカルでuvicornを起動（または既存のサーバーを指定）し、/api/process と
+/api/process-multiple へのリクエストを指定した比率で送信します。
+エンドポイントごとのスループット、p50/p95/p99レイテンシ、エラー率と、
+サーバープロセスのRSS推移を表示します。
+
+使い方（backendディレクトリで実行）:
+    python -m app.tools.loadtest --duration 30 --concurrency 8 --mix process=3,process-multiple=1
+    python -m app.tools.loadtest --url http://localhost:8000 --pid 12345
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from app.services.codecs import synthetic_gradient
+from app.services.lanes import percentile
+
+ENDPOINTS = {
+    "process": "/api/process",
+    "process-multiple": "/api/process-multiple",
+}
+
+
+def generate_images(sizes: list[tuple[int, int]], seed: int) -> list[bytes]:
+    """合成画像（グラデーション + ノイズ）をJPEGで生成"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for size in sizes:
+        output = io.BytesIO()
+        Image.fromarray(synthetic_gradient(size, noise=20, rng=rng)).save(output, format="JPEG", quality=90)
+        images.append(output.getvalue())
+    return images
+
+
+def _child_pids(pid: int) -> list[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """/proc から RSS (MB) を取得（Linuxのみ、子プロセス＝ワーカーの分も合算）"""
+    total_kb = 0
+    found = False
+    for target in [pid, *_child_pids(pid)]:
+        try:
+            with open(f"/proc/{target}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        found = True
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024 if found else None
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """"process=3,process-multiple=1" 形式の比率をパース"""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"不明なエンドポイント: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_sizes(value: str) -> list[tuple[int, int]]:
+    """"2000x1500,800x600" 形式のサイズをパース"""
+    sizes = []
+    for item in value.split(","):
+        width, _, height = item.lower().partition("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    """backendディレクトリでuvicornを起動"""
+    backend_dir = Path(__file__).resolve().parents[2]
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=backend_dir,
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/health")
+            if response.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("サーバーが起動しませんでした")
+
+
+async def send_request(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    images: list[bytes],
+    rng: random.Random,
+    args: argparse.Namespace,
+) -> int:
+    data = {"mode": rng.choice(["vertical", "horizontal"]), "upscale_method": args.upscale_method}
+    if endpoint == "process":
+        files = {"file": ("image.jpg", rng.choice(images), "image/jpeg")}
+    else:
+        files = [
+            ("files", (f"image_{i + 1}.jpg", rng.choice(images), "image/jpeg"))
+            for i in range(args.images_per_request)
+        ]
+    response = await client.post(ENDPOINTS[endpoint], data=data, files=files)
+    # レスポンス本体を最後まで受信してから計測を終える
+    await response.aread()
+    return response.status_code
+
+
+async def run_load(args: argparse.Namespace, base_url: str, pid: Optional[int]) -> dict:
+    images = generate_images(args.sizes, args.seed)
+    mix = args.mix
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    results = {name: {"latencies": [], "errors": 0} for name in names}
+    rss_samples = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client, args.startup_timeout)
+
+        started = time.monotonic()
+        deadline = started + args.duration
+
+        async def worker(worker_id: int):
+            rng = random.Random(args.seed + worker_id)
+            while time.monotonic() < deadline:
+                endpoint = rng.choices(names, weights)[0]
+                request_started = time.perf_counter()
+                try:
+                    status = await send_request(client, endpoint, images, rng, args)
+                    ok = status == 200
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = time.perf_counter() - request_started
+                if ok:
+                    results[endpoint]["latencies"].append(elapsed)
+                else:
+                    results[endpoint]["errors"] += 1
+
+        async def sample_rss():
+            while time.monotonic() < deadline:
+                rss = read_rss_mb(pid)
+                if rss is not None:
+                    rss_samples.append((time.monotonic() - started, rss))
+                await asyncio.sleep(args.rss_interval)
+
+        tasks = [asyncio.create_task(worker(i)) for i in range(args.concurrency)]
+        if pid is not None:
+            tasks.append(asyncio.create_task(sample_rss()))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    report = {"duration": elapsed, "concurrency": args.concurrency, "endpoints": {}, "rss_mb": rss_samples}
+    for name, result in results.items():
+        latencies = sorted(result["latencies"])
+        total = len(latencies) + result["errors"]
+        report["endpoints"][name] = {
+            "requests": total,
+            "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "error_rate": result["errors"] / total if total else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    return report
+
+
+def print_report(report: dict):
+    print(f"実行時間: {report['duration']:.1f}秒, 同時接続数: {report['concurrency']}")
+    print(f"{'endpoint':<18}{'requests':>10}{'rps':>9}{'errors':>9}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, stats in report["endpoints"].items():
+        print(
+            f"{name:<18}{stats['requests']:>10}{stats['throughput_rps']:>9.2f}"
+            f"{stats['error_rate'] * 100:>8.1f}%{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    if report["rss_mb"]:
+        print("サーバーRSS推移:")
+        for t, rss in report["rss_mb"]:
+            print(f"  {t:6.1f}s  {rss:8.1f} MB")
+        print(f"  最大: {max(rss for _, rss in report['rss_mb']):.1f} MB")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="画像処理APIのローカル負荷試験")
+    parser.add_argument("--url", help="既存サーバーのURL（省略時はuvicornを起動）")
+    parser.add_argument("--pid", type=int, help="RSSを計測するサーバープロセスのPID（--url指定時）")
+    parser.add_argument("--server-workers", type=int, default=1, help="起動するuvicornのワーカー数")
+    parser.add_argument("--duration", type=float, default=30.0, help="計測時間（秒）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時リクエスト数")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("process=3,process-multiple=1"),
+                        help="エンドポイントの比率（例: process=3,process-multiple=1）")
+    parser.add_argument("--images-per-request", type=int, default=4, help="/api/process-multiple の1リクエストあたりの画像数")
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("2000x1500,1200x1600,640x480"),
+                        help="合成画像のサイズ（例: 2000x1500,640x480）")
+    parser.add_argument("--upscale-method", default="simple")
+    parser.add_argument("--timeout", type=float, default=120.0, help="リクエストのタイムアウト（秒）")
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--rss-interval", type=float, default=1.0, help="RSSのサンプリング間隔（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    server = None
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.pid
+    else:
+        port = _free_port()
+        server = start_server(port, args.server_workers)
+        base_url, pid = f"http://127.0.0.1:{port}", server.pid
+
+    try:
+        report = asyncio.run(run_load(args, base_url, pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+マルチワーカー運用時のメモリ共有チェック
+
+gunicornの親プロセスのPIDを指定し、各ワーカーの /proc/<pid>/smaps から
+RSS・PSS・共有メモリ量を集計します。
+
+共有ライブラリのコード（torchなど）はフォークしなくても共有されるため、判定には
+匿名メモリ（ヒープ・匿名mmap）のうち他のプロセスと共有されている量を使います。
+フォーク前に読み込んだAIモデルの重みがワーカー間で共有されていれば、
+各ワーカーの共有匿名メモリはモデルサイズ以上になります。
+
+使い方（Linuxのみ）:
+    python -m app.tools.memcheck <gunicornの親PID> --min-shared-mb 60
+"""
+import argparse
+import re
+import sys
+from typing import Optional
+
+# smapsから読み取る項目
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+# マッピングの見出し行（アドレス範囲 権限 オフセット デバイス inode [パス]）
+_MAPPING_HEADER = re.compile(r"^[0-9a-f]+-[0-9a-f]+\s")
+
+
+def _is_anonymous(pathname: str) -> bool:
+    """ファイルに対応しないマッピング（ヒープ・匿名mmap）。スタックやvdsoは除く"""
+    return pathname == "" or pathname == "[heap]" or pathname.startswith("[anon")
+
+
+def read_smaps(pid: int) -> dict[str, float]:
+    """
+    /proc/<pid>/smaps の各項目の合計と、匿名マッピングの共有量（Shared_Anon）をMB単位で返す
+    """
+    values = {key: 0.0 for key in (*FIELDS, "Shared_Anon")}
+    anonymous = False
+    with open(f"/proc/{pid}/smaps", "r") as f:
+        for line in f:
+            if _MAPPING_HEADER.match(line):
+                fields = line.split(maxsplit=5)
+                anonymous = _is_anonymous(fields[5].strip() if len(fields) > 5 else "")
+                continue
+            key, _, rest = line.partition(":")
+            if key in FIELDS:
+                size = int(rest.split()[0]) / 1024
+                values[key] += size
+                if anonymous and key in ("Shared_Clean", "Shared_Dirty"):
+                    values["Shared_Anon"] += size
+    return values
+
+
+def child_pids(pid: int) -> list[int]:
+    with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ワーカー間のメモリ共有状況を確認します")
+    parser.add_argument("pid", type=int, help="gunicornの親プロセスのPID")
+    parser.add_argument(
+        "--min-shared-mb",
+        type=float,
+        required=True,
+        help="各ワーカーに必要な共有匿名メモリ量（MB、必須）。モデルの重みのサイズを指定（例: RealESRGAN_x4plusは約64MB）",
+    )
+    args = parser.parse_args(argv)
+    if args.min_shared_mb <= 0:
+        # 0以下では常に合格になり、何も確認できないため
+        parser.error("--min-shared-mb には正の値（モデルの重みのサイズ）を指定してください")
+
+    workers = child_pids(args.pid)
+    if not workers:
+        print(f"PID {args.pid} にワーカープロセスがありません")
+        return 1
+
+    print(f"{'pid':>8}{'rss(MB)':>10}{'pss(MB)':>10}{'shared(MB)':>12}{'shared_anon(MB)':>17}{'private(MB)':>13}")
+    total_rss = total_pss = 0.0
+    failed = []
+    for pid in [args.pid, *workers]:
+        stats = read_smaps(pid)
+        shared = stats["Shared_Clean"] + stats["Shared_Dirty"]
+        private = stats["Private_Clean"] + stats["Private_Dirty"]
+        total_rss += stats["Rss"]
+        total_pss += stats["Pss"]
+        label = f"{pid}" if pid != args.pid else f"{pid}*"
+        print(
+            f"{label:>8}{stats['Rss']:>10.1f}{stats['Pss']:>10.1f}{shared:>12.1f}"
+            f"{stats['Shared_Anon']:>17.1f}{private:>13.1f}"
+        )
+        # 共有ライブラリは共有されて当然のため、匿名メモリの共有量で判定する
+        if pid != args.pid and stats["Shared_Anon"] < args.min_shared_mb:
+            failed.append(pid)
+
+    print(f"合計: RSS={total_rss:.1f}MB, PSS={total_pss:.1f}MB（* は親プロセス）")
+    print(f"共有による節約量: {total_rss - total_pss:.1f}MB")
+    if failed:
+        print(f"共有匿名メモリが {args.min_shared_mb:.1f}MB 未満のワーカー: {', '.join(map(str, failed))}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
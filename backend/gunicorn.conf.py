@@ -0,0 +1,22 @@
+"""
+gunicornの設定（マルチワーカー運用）
+
+起動方法（backendディレクトリで実行）:
+    PRELOAD_AI_MODEL=1 WEB_CONCURRENCY=4 gunicorn -c gunicorn.conf.py app.main:app
+
+preload_appにより親プロセスでアプリ（とAIモデル）を読み込んでからワーカーをフォークするため、
+モデルの重みはワーカー間でコピーオンライトにより共有されます。
+uvicornの --workers はワーカーを個別に起動するため、重みは共有されません。
+"""
+import os
+
+# ワーカー数（デフォルト: 2）
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# フォーク前に親プロセスでアプリを読み込む
+preload_app = True
+
+# AIアップスケールは時間がかかるため、タイムアウトを長めに設定
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
@@ -0,0 +1,10 @@
+"""
+バックエンドのテスト設定（backend ディレクトリをインポートパスに追加）
+
+実行（リポジトリのルートで）:
+    python -m pytest backend/tests
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,57 @@
+"""
+OnnxUpscaler のテスト（export_onnx.build_tiny_model で作成した4倍の線形補間モデルを使用）
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+from app.services.onnx_upscaler import OnnxUpscaler  # noqa: E402
+from app.tools.export_onnx import build_tiny_model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory) -> str:
+    path = tmp_path_factory.mktemp("onnx") / "tiny_x4.onnx"
+    build_tiny_model(path)
+    return str(path)
+
+
+def _image(width: int, height: int) -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("size", [(70, 45), (64, 64), (33, 97), (1, 1)])
+def test_enhance_returns_model_scale(tiny_model, size):
+    width, height = size
+    output, _ = OnnxUpscaler(tiny_model).enhance(_image(width, height), outscale=4)
+    assert output.shape == (height * 4, width * 4, 3)
+    assert output.dtype == np.uint8
+
+
+@pytest.mark.parametrize("size", [(70, 45), (64, 64), (33, 97), (129, 17)])
+@pytest.mark.parametrize("tile, tile_pad", [(16, 4), (32, 10), (24, 0)])
+def test_tiled_matches_untiled(tiny_model, size, tile, tile_pad):
+    image = _image(*size)
+    untiled, _ = OnnxUpscaler(tiny_model).enhance(image, outscale=4)
+    tiled_upscaler = OnnxUpscaler(tiny_model, tile=tile, tile_pad=tile_pad)
+    tiled, _ = tiled_upscaler.enhance(image, outscale=4)
+
+    assert tiled.shape == untiled.shape
+    if tile_pad == 0:
+        # パディングなしでは線形補間がタイルの境界で端の画素を参照するため、境界以外のみ一致する
+        inner = np.ones(untiled.shape[:2], dtype=bool)
+        for edge in range(tile * 4, untiled.shape[0], tile * 4):
+            inner[edge - 2:edge + 2, :] = False
+        for edge in range(tile * 4, untiled.shape[1], tile * 4):
+            inner[:, edge - 2:edge + 2] = False
+        np.testing.assert_array_equal(tiled[inner], untiled[inner])
+    else:
+        np.testing.assert_array_equal(tiled, untiled)
+
+
+def test_outscale_resizes_to_requested_size(tiny_model):
+    output, _ = OnnxUpscaler(tiny_model, tile=16).enhance(_image(40, 30), outscale=2)
+    assert output.shape == (60, 80, 3)
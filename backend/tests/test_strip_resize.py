@@ -0,0 +1,52 @@
+"""
+StripResizer のテスト
+"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services.image_processor import ImageProcessor
+from app.services.strip_resize import StripResizer
+
+
+@pytest.mark.parametrize("data", [b"ab", b"\xff\xd8", b"BM", b"\x00" * 20])
+def test_short_or_unknown_data_is_unidentified(data):
+    resizer = StripResizer(min_pixels=1, budget_bytes=1 << 20)
+    with pytest.raises(Image.UnidentifiedImageError):
+        resizer.resize(data, (1080, 1350))
+
+
+def test_small_data_skips_header_parse():
+    # 40MP以上の画像になり得ない大きさのデータは、形式を判別せずに対象外とする
+    resizer = StripResizer(min_pixels=40_000_000, budget_bytes=1 << 20)
+    assert resizer.resize(b"not an image", (1080, 1350)) is None
+
+
+def test_pixel_limit_replaces_pillow_limit():
+    output = io.BytesIO()
+    Image.new("RGB", (4000, 3000)).save(output, format="BMP")
+    data = output.getvalue()
+    with pytest.raises(Image.DecompressionBombError):
+        StripResizer(min_pixels=1, budget_bytes=1 << 20, max_pixels=10_000_000).resize(data, (1080, 1350))
+    resized, source_size = StripResizer(min_pixels=1, budget_bytes=1 << 20).resize(data, (1080, 1350))
+    assert resized.size == (1080, 1350) and source_size == (4000, 3000)
+
+
+@pytest.fixture(scope="module")
+def processor() -> ImageProcessor:
+    return ImageProcessor()
+
+
+@pytest.mark.parametrize("size", [(4000, 3000), (1200, 5000), (2160, 2700)])
+def test_strips_match_processor_resize(processor, size):
+    # 帯ごとの縮小と ImageProcessor._resize_to_target は同じ cover_geometry を使う
+    pixels = np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format="BMP")
+    resized, _ = StripResizer(min_pixels=1, budget_bytes=1 << 20).resize(output.getvalue(), (1080, 1350))
+    expected = processor._resize_to_target(Image.fromarray(pixels), (1080, 1350))
+    difference = np.abs(np.asarray(resized, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+    assert resized.size == expected.size == (1080, 1350)
+    assert difference.mean() < 0.5
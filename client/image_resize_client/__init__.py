@@ -0,0 +1,19 @@
+from image_resize_client.client import (
+    AsyncImageResizeClient,
+    BatchResult,
+    ImageResizeError,
+    ImageResult,
+    ImageSource,
+    ProcessedImage,
+)
+from image_resize_client.sync import ImageResizeClient
+
+__all__ = [
+    "AsyncImageResizeClient",
+    "BatchResult",
+    "ImageResizeClient",
+    "ImageResizeError",
+    "ImageResult",
+    "ImageSource",
+    "ProcessedImage",
+]
@@ -0,0 +1,326 @@
+"""
+画像リサイズ高解像度化APIの非同期クライアント
+
+- 接続プール付きのhttpx.AsyncClientを使い回します
+- ファイルはディスクから分割して送信します（全体をメモリに読み込みません）
+- 429 / 503 の場合は Retry-After に従って再送します
+- 多数の画像はサーバーの MAX_IMAGES ごとに分割し、同時実行数を制限して送信します
+"""
+import asyncio
+import base64
+import email.utils
+import json
+import mimetypes
+import os
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import httpx
+
+# 画像の指定方法: ファイルのパス、または (ファイル名, バイトデータ)
+ImageSource = Union[str, os.PathLike, tuple[str, bytes]]
+
+# 再送するステータスコード
+RETRY_STATUS_CODES = (429, 503)
+# /api/limits がないサーバーの場合の MAX_IMAGES
+DEFAULT_MAX_IMAGES = 8
+
+
+class ImageResizeError(Exception):
+    """APIがエラーを返した場合の例外"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class ProcessedImage:
+    """処理済みの画像（quality はサーバーが選択したJPEGの品質）"""
+    filename: str
+    data: bytes
+    content_type: str
+    quality: Optional[int] = None
+
+
+@dataclass
+class ImageResult:
+    """入力1件分の処理結果（image と error のどちらか一方が設定される）"""
+    index: int  # 入力の位置（process_many に渡したリストのインデックス）
+    filename: str
+    image: Optional[ProcessedImage] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchResult:
+    """複数画像の処理結果（results は入力と同じ順序・同じ件数）"""
+    results: list[ImageResult] = field(default_factory=list)
+
+    @property
+    def images(self) -> list[ProcessedImage]:
+        """成功した画像（入力の順序）"""
+        return [r.image for r in self.results if r.image is not None]
+
+    @property
+    def errors(self) -> list[str]:
+        """失敗した入力のエラーメッセージ（入力の順序）"""
+        return [r.error for r in self.results if r.error is not None]
+
+
+def _filename(source: ImageSource) -> str:
+    if isinstance(source, tuple):
+        return source[0]
+    return Path(source).name
+
+
+def _open_part(source: ImageSource, stack: ExitStack) -> tuple:
+    """multipartのファイルパート（パスの場合はファイルを開いて分割送信）"""
+    filename = _filename(source)
+    content_type = mimetypes.guess_type(filename)[0] or "image/jpeg"
+    if isinstance(source, tuple):
+        return (filename, source[1], content_type)
+    return (filename, stack.enter_context(open(source, "rb")), content_type)
+
+
+def _form_data(mode: str, upscale_method: str, max_bytes: Optional[int], min_psnr: Optional[float], **extra) -> dict:
+    data = {"mode": mode, "upscale_method": upscale_method, **extra}
+    if max_bytes is not None:
+        data["max_bytes"] = str(max_bytes)
+    if min_psnr is not None:
+        data["min_psnr"] = str(min_psnr)
+    return data
+
+
+def _decode_data_url(data_url: str) -> bytes:
+    return base64.b64decode(data_url.split(",", 1)[1])
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Retry-After ヘッダー（秒数またはHTTP日付）を秒数に変換"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_detail(response: httpx.Response) -> str:
+    try:
+        return str(response.json().get("detail", response.text))
+    except ValueError:
+        return response.text
+
+
+class AsyncImageResizeClient:
+    """
+    画像リサイズ高解像度化APIの非同期クライアント
+
+    使い方:
+        async with AsyncImageResizeClient("http://localhost:8000") as client:
+            image = await client.process("photo.jpg", mode="vertical")
+            result = await client.process_many(paths, upscale_method="enhance")
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        max_retry_wait: float = 60.0,
+        max_images: Optional[int] = None,
+        timeout: float = 300.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Args:
+            base_url: APIのURL
+            max_concurrency: 同時に送信するリクエスト数（接続プールの上限も兼ねる）
+            max_retries: 429 / 503 の場合の最大再送回数
+            max_retry_wait: 再送までの最大待ち時間（秒）
+            max_images: 1リクエストあたりの最大画像数（省略時はサーバーの /api/limits から取得）
+            timeout: リクエストのタイムアウト（秒）。AIアップスケールは数分かかる場合があります
+            transport: httpxのトランスポート（httpx.ASGITransport でアプリを同一プロセスで呼び出す場合など）
+        """
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self._max_images = max_images
+        self.max_concurrency = max_concurrency
+        # 実行中のイベントループで作成する（Python 3.9では作成時のループに結び付くため）
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=transport
+        )
+
+    async def __aenter__(self) -> "AsyncImageResizeClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _concurrency_limit(self) -> asyncio.Semaphore:
+        """同時に送信するリクエスト数の制限（最初の送信時に作成）"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        sources: Sequence[ImageSource] = (),
+        file_field: str = "files",
+        **kwargs
+    ) -> httpx.Response:
+        """
+        リクエストを送信し、429 / 503 の場合は待機して再送します。
+        ファイルは送信のたびに開き直します。
+        """
+        for attempt in range(self.max_retries + 1):
+            with ExitStack() as stack:
+                files = [(file_field, _open_part(s, stack)) for s in sources] or None
+                response = await self._client.request(method, url, files=files, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+            wait = _retry_after(response)
+            if wait is None:
+                wait = 2 ** attempt
+            await asyncio.sleep(min(wait, self.max_retry_wait))
+        return response
+
+    async def max_images(self) -> int:
+        """1リクエストあたりの最大画像数（サーバーの MAX_IMAGES）"""
+        if self._max_images is None:
+            response = await self._send("GET", "/api/limits")
+            if response.status_code == 200:
+                self._max_images = int(response.json()["max_images"])
+            else:
+                self._max_images = DEFAULT_MAX_IMAGES
+        return self._max_images
+
+    async def process(
+        self,
+        source: ImageSource,
+        mode: str = "vertical",
+        upscale_method: str = "simple",
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None
+    ) -> ProcessedImage:
+        """
+        1枚の画像を処理します（/api/process）。
+
+        max_bytes / min_psnr を指定すると、サーバーが出力サイズの上限・画質の下限を満たす
+        JPEGの品質を選択します。
+
+        Raises:
+            ImageResizeError: APIがエラーを返した場合
+        """
+        async with self._concurrency_limit():
+            response = await self._send(
+                "POST", "/api/process", [source],
+                file_field="file",
+                data=_form_data(mode, upscale_method, max_bytes, min_psnr)
+            )
+        if response.status_code != 200:
+            raise ImageResizeError(response.status_code, _error_detail(response))
+        return ProcessedImage(
+            filename=_filename(source),
+            data=response.content,
+            content_type=response.headers.get("content-type", "image/jpeg"),
+            quality=int(response.headers["X-JPEG-Quality"]) if "X-JPEG-Quality" in response.headers else None
+        )
+
+    async def _process_chunk(
+        self,
+        sources: Sequence[ImageSource],
+        mode: str,
+        upscale_method: str,
+        max_bytes: Optional[int],
+        min_psnr: Optional[float]
+    ) -> dict[int, ImageResult]:
+        """/api/process-multiple に1回分を送信（結果はNDJSONで受け取り、チャンク内の位置ごとに返す）"""
+        async with self._concurrency_limit():
+            response = await self._send(
+                "POST", "/api/process-multiple", sources,
+                data=_form_data(mode, upscale_method, max_bytes, min_psnr, response_format="ndjson")
+            )
+        if response.status_code != 200:
+            raise ImageResizeError(response.status_code, _error_detail(response))
+
+        results = {}
+        for line in response.text.splitlines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "image":
+                results[event["index"]] = ImageResult(
+                    index=event["index"],
+                    filename=event["filename"],
+                    image=ProcessedImage(
+                        filename=event["filename"],
+                        data=_decode_data_url(event["data"]),
+                        content_type=event["content_type"],
+                        quality=event.get("quality")
+                    )
+                )
+            elif event["type"] == "error":
+                results[event["index"]] = ImageResult(
+                    index=event["index"], filename=event["filename"], error=event["error"]
+                )
+        return results
+
+    async def process_many(
+        self,
+        sources: Sequence[ImageSource],
+        mode: str = "vertical",
+        upscale_method: str = "simple",
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None
+    ) -> BatchResult:
+        """
+        複数の画像を処理します（/api/process-multiple）。
+
+        サーバーの MAX_IMAGES ごとに分割し、max_concurrency 件まで同時に送信します。
+        結果は BatchResult.results[i] が sources[i] に対応し、画像ごとのエラーは
+        ImageResult.error に格納されます（同じファイル名の入力があっても位置で区別できます）。
+
+        Raises:
+            ImageResizeError: リクエスト自体がエラーになった場合
+        """
+        chunk_size = await self.max_images()
+        offsets = range(0, len(sources), chunk_size)
+        chunks = await asyncio.gather(*[
+            self._process_chunk(sources[offset:offset + chunk_size], mode, upscale_method, max_bytes, min_psnr)
+            for offset in offsets
+        ])
+
+        result = BatchResult()
+        for offset, chunk in zip(offsets, chunks):
+            for idx in range(min(chunk_size, len(sources) - offset)):
+                item = chunk.get(idx)
+                if item is None:
+                    name = _filename(sources[offset + idx])
+                    item = ImageResult(index=idx, filename=name, error=f"{name}: サーバーから結果が返されませんでした")
+                item.index = offset + idx
+                result.results.append(item)
+        return result
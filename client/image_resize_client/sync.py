@@ -0,0 +1,66 @@
+"""
+画像リサイズ高解像度化APIの同期クライアント
+
+AsyncImageResizeClient を専用のイベントループで実行します。
+接続プールは呼び出しの間で使い回されます。
+"""
+import asyncio
+from typing import Optional, Sequence
+
+from image_resize_client.client import AsyncImageResizeClient, BatchResult, ImageSource, ProcessedImage
+
+
+class ImageResizeClient:
+    """
+    AsyncImageResizeClient の同期版（引数は AsyncImageResizeClient と同じ）
+
+    使い方:
+        with ImageResizeClient("http://localhost:8000") as client:
+            image = client.process("photo.jpg")
+            result = client.process_many(paths, mode="horizontal")
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        # httpx.AsyncClient はイベントループ上で作成する
+        self._client: AsyncImageResizeClient = self._loop.run_until_complete(self._create(*args, **kwargs))
+
+    @staticmethod
+    async def _create(*args, **kwargs) -> AsyncImageResizeClient:
+        return AsyncImageResizeClient(*args, **kwargs)
+
+    def __enter__(self) -> "ImageResizeClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if not self._loop.is_closed():
+            self._loop.run_until_complete(self._client.aclose())
+            self._loop.close()
+
+    def max_images(self) -> int:
+        return self._loop.run_until_complete(self._client.max_images())
+
+    def process(
+        self,
+        source: ImageSource,
+        mode: str = "vertical",
+        upscale_method: str = "simple",
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None
+    ) -> ProcessedImage:
+        return self._loop.run_until_complete(self._client.process(source, mode, upscale_method, max_bytes, min_psnr))
+
+    def process_many(
+        self,
+        sources: Sequence[ImageSource],
+        mode: str = "vertical",
+        upscale_method: str = "simple",
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None
+    ) -> BatchResult:
+        return self._loop.run_until_complete(
+            self._client.process_many(sources, mode, upscale_method, max_bytes, min_psnr)
+        )
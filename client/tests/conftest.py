@@ -0,0 +1,12 @@
+"""
+クライアントのテスト設定
+
+バックエンドのアプリを httpx.ASGITransport で同一プロセスで呼び出すため、
+backend ディレクトリをインポートパスに追加します。
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "client"))
+sys.path.insert(0, str(ROOT / "backend"))
@@ -0,0 +1,146 @@
+"""
+AsyncImageResizeClient のテスト（バックエンドのアプリを同一プロセスで呼び出す）
+
+実行（リポジトリのルートで）:
+    pip install -r backend/requirements.txt -e "./client[test]"
+    python -m pytest client/tests
+"""
+import asyncio
+import io
+
+import httpx
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.main import app
+from app.routers.image import MAX_IMAGES, processor
+from app.services.lanes import LaneFullError
+from image_resize_client import AsyncImageResizeClient, ImageResizeError
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """ASGITransport に渡したリクエストを記録する"""
+
+    def __init__(self):
+        self._transport = httpx.ASGITransport(app=app)
+        self.requests: list[str] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(f"{request.method} {request.url.path}")
+        return await self._transport.handle_async_request(request)
+
+
+def _jpeg(seed: int, size=(64, 48)) -> bytes:
+    """入力ごとに内容の異なるJPEG（同じ内容の処理はサーバーでまとめられるため）"""
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _run(transport: httpx.AsyncBaseTransport, func, **kwargs):
+    async def main():
+        async with AsyncImageResizeClient("http://testserver", transport=transport, **kwargs) as client:
+            return await func(client)
+    return asyncio.run(main())
+
+
+def test_process_returns_resized_jpeg():
+    transport = CountingTransport()
+    image = _run(transport, lambda c: c.process(("photo.jpg", _jpeg(0)), mode="horizontal", max_bytes=200_000))
+
+    assert image.filename == "photo.jpg"
+    assert image.content_type == "image/jpeg"
+    assert image.quality is not None
+    assert len(image.data) <= 200_000
+    assert Image.open(io.BytesIO(image.data)).size == (1350, 1080)
+    assert transport.requests == ["POST /api/process"]
+
+
+def test_process_raises_on_api_error():
+    with pytest.raises(ImageResizeError) as excinfo:
+        _run(CountingTransport(), lambda c: c.process(("broken.jpg", b"not an image")))
+    assert excinfo.value.status_code == 400
+
+
+def test_process_many_chunks_by_max_images_and_keeps_input_positions():
+    count = MAX_IMAGES + 3
+    sources = [("same.jpg", _jpeg(seed)) for seed in range(count)]
+    broken = MAX_IMAGES + 1  # 2つ目のリクエストに含まれる入力
+    sources[broken] = ("same.jpg", b"not an image")
+    transport = CountingTransport()
+
+    result = _run(transport, lambda c: c.process_many(sources))
+
+    # サーバーの MAX_IMAGES を /api/limits から取得して分割する
+    assert transport.requests.count("GET /api/limits") == 1
+    assert transport.requests.count("POST /api/process-multiple") == 2
+    assert [r.index for r in result.results] == list(range(count))
+    for r in result.results:
+        if r.index == broken:
+            assert not r.ok and r.image is None and r.error
+        else:
+            assert r.ok and r.error is None
+            assert Image.open(io.BytesIO(r.image.data)).size == (1080, 1350)
+    assert len(result.images) == count - 1
+    assert len(result.errors) == 1
+
+
+def test_retries_after_429_using_retry_after(monkeypatch):
+    lane = processor.lane_for("simple")
+    admit = lane.admit
+    rejected = []
+
+    def admit_once_full():
+        if not rejected:
+            rejected.append(True)
+            raise LaneFullError(lane.name)
+        admit()
+
+    monkeypatch.setattr(lane, "admit", admit_once_full)
+    monkeypatch.setattr(lane, "estimated_wait", lambda: 7)
+
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    transport = CountingTransport()
+
+    image = _run(transport, lambda c: c.process(("photo.jpg", _jpeg(1))))
+
+    assert Image.open(io.BytesIO(image.data)).size == (1080, 1350)
+    assert transport.requests == ["POST /api/process", "POST /api/process"]
+    assert sleeps == [7]
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    lane = processor.lane_for("simple")
+
+    def always_full():
+        raise LaneFullError(lane.name)
+
+    monkeypatch.setattr(lane, "admit", always_full)
+    monkeypatch.setattr(lane, "estimated_wait", lambda: 0)
+    transport = CountingTransport()
+
+    with pytest.raises(ImageResizeError) as excinfo:
+        _run(transport, lambda c: c.process(("photo.jpg", _jpeg(2))), max_retries=2)
+    assert excinfo.value.status_code == 429
+    assert len(transport.requests) == 3
+
+
+def test_client_created_outside_event_loop():
+    # イベントループの外で作成したクライアントを、後から asyncio.run の中で同時に使う
+    client = AsyncImageResizeClient("http://testserver", transport=CountingTransport(), max_concurrency=1)
+
+    async def main():
+        async with client:
+            return await asyncio.gather(*[client.process((f"{i}.jpg", _jpeg(10 + i))) for i in range(3)])
+
+    images = asyncio.run(main())
+    assert [image.filename for image in images] == ["0.jpg", "1.jpg", "2.jpg"]